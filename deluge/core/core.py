@@ -78,8 +78,8 @@ class Core(component.Component):
         # Create the client fingerprint
         version = [int(value.split("-")[0]) for value in
                    deluge.common.get_version().split(".")]
-        while len(version) < 4:
-            version.append(0)
+        # Pad out to the four fields the fingerprint expects
+        version += [0] * (4 - len(version))
 
         # Note: All libtorrent python bindings to set plugins/extensions need to be disabled
         # due to  GIL issue. https://code.google.com/p/libtorrent/issues/detail?id=369
@@ -329,6 +329,36 @@ class Core(component.Component):
         log.debug("Removing torrent %s from the core.", torrent_id)
         return self.torrentmanager.remove(torrent_id, remove_data)
 
+    @export
+    def remove_torrents(self, torrent_ids, remove_data):
+        """
+        Removes multiple torrents from the session, saving the session state
+        and the resume data only once for the whole batch.
+
+        :param torrent_ids: the torrent_ids of the torrents to remove
+        :type torrent_ids: list
+        :param remove_data: if True, remove the data associated with these torrents
+        :type remove_data: boolean
+        :returns: an empty list if all torrents were removed, otherwise a list
+            of (torrent_id, error message) tuples
+        :rtype: list
+
+        """
+        log.debug("Removing torrents %s from the core.", torrent_ids)
+        errors = []
+        resume_data = self.torrentmanager.load_resume_data_file()
+        for torrent_id in torrent_ids:
+            try:
+                if not self.torrentmanager.remove(torrent_id, remove_data,
+                                                  save_state=False,
+                                                  resume_data=resume_data):
+                    errors.append((torrent_id, "Error removing torrent"))
+            except InvalidTorrentError, e:
+                errors.append((torrent_id, str(e)))
+        self.torrentmanager.save_resume_data_file(resume_data)
+        self.torrentmanager.save_state()
+        return errors
+
     @export
     def get_session_status(self, keys):
         """
@@ -427,17 +457,29 @@ class Core(component.Component):
 
     @export
     def get_torrent_status(self, torrent_id, keys, diff=False):
-        # Build the status dictionary
+        return self._get_torrent_status(
+            torrent_id, keys, self.pluginmanager.get_status_fields(keys), diff)
+
+    def _get_torrent_status(self, torrent_id, keys, plugin_fields, diff):
+        """
+        Builds the status dictionary for `torrent_id`. `plugin_fields` are the
+        fields in `keys` provided by plugins, passed in so that bulk callers
+        only need to work them out once.
+        """
         try:
-            status = self.torrentmanager[torrent_id].get_status(keys, diff)
+            torrent = self.torrentmanager[torrent_id]
         except KeyError:
             # Torrent was probaly removed meanwhile
             return {}
 
-        # Get the leftover fields and ask the plugin manager to fill them
-        leftover_fields = list(set(keys) - set(status.keys()))
-        if len(leftover_fields) > 0:
-            status.update(self.pluginmanager.get_status(torrent_id, leftover_fields))
+        # Build the status dictionary
+        status = torrent.get_status(keys, diff)
+
+        # Ask the plugin manager to fill in the fields the torrent didn't
+        if plugin_fields:
+            for field, value in self.pluginmanager.get_status(
+                    torrent_id, plugin_fields).iteritems():
+                status.setdefault(field, value)
         return status
 
     @export
@@ -447,10 +489,12 @@ class Core(component.Component):
         """
         torrent_ids = self.filtermanager.filter_torrent_ids(filter_dict)
         status_dict = {}.fromkeys(torrent_ids)
+        plugin_fields = self.pluginmanager.get_status_fields(keys)
 
         # Get the torrent status for each torrent_id
         for torrent_id in torrent_ids:
-            status_dict[torrent_id] = self.get_torrent_status(torrent_id, keys, diff)
+            status_dict[torrent_id] = self._get_torrent_status(
+                torrent_id, keys, plugin_fields, diff)
 
         return status_dict
 
@@ -99,6 +99,10 @@ class PluginManager(deluge.pluginmanagerbase.PluginManagerBase,
                 pass
         return status
 
+    def get_status_fields(self, keys):
+        """Returns the fields in `keys` that are provided by plugins."""
+        return [key for key in keys if key in self.status_fields]
+
     def register_status_field(self, field, function):
         """Register a new status field.  This can be used in the same way the
         client requests other status information from core."""
@@ -140,6 +140,10 @@ DEFAULT_PREFS = {
     "geoip_db_location": "/usr/share/GeoIP/GeoIP.dat",
     "cache_size": 512,
     "cache_expiry": 60,
+    "file_pool_size": 40,
+    "listen_queue_size": 5,
+    "send_socket_buffer_size": 0,
+    "recv_socket_buffer_size": 0,
     "auto_manage_prefer_seeds": False,
     "shared": False
 }
@@ -195,9 +199,10 @@ class PreferencesManager(component.Component):
     def _on_set_listen_ports(self, key, value):
         # Only set the listen ports if random_port is not true
         if self.config["random_port"] is not True:
-            log.debug("listen port range set to %s-%s", value[0], value[1])
+            port_low, port_high = value
+            log.debug("listen port range set to %s-%s", port_low, port_high)
             self.session.listen_on(
-                value[0], value[1], str(self.config["listen_interface"])
+                port_low, port_high, str(self.config["listen_interface"])
             )
 
     def _on_set_listen_interface(self, key, value):
@@ -210,19 +215,15 @@ class PreferencesManager(component.Component):
         # and then handle accordingly.
         if value:
             import random
-            listen_ports = []
-            randrange = lambda: random.randrange(49152, 65525)
-            listen_ports.append(randrange())
-            listen_ports.append(listen_ports[0]+10)
+            port_low = random.randrange(49152, 65525)
+            port_high = port_low + 10
         else:
-            listen_ports = self.config["listen_ports"]
+            port_low, port_high = self.config["listen_ports"]
 
         # Set the listen ports
-        log.debug("listen port range set to %s-%s", listen_ports[0],
-            listen_ports[1])
+        log.debug("listen port range set to %s-%s", port_low, port_high)
         self.session.listen_on(
-            listen_ports[0], listen_ports[1],
-            str(self.config["listen_interface"])
+            port_low, port_high, str(self.config["listen_interface"])
         )
 
     def _on_set_outgoing_ports(self, key, value):
@@ -475,6 +476,22 @@ class PreferencesManager(component.Component):
         log.debug("%s: %s", key, value)
         self.session_set_setting("cache_expiry", value)
 
+    def _on_set_file_pool_size(self, key, value):
+        log.debug("%s: %s", key, value)
+        self.session_set_setting("file_pool_size", value)
+
+    def _on_set_listen_queue_size(self, key, value):
+        log.debug("%s: %s", key, value)
+        self.session_set_setting("listen_queue_size", value)
+
+    def _on_set_send_socket_buffer_size(self, key, value):
+        log.debug("%s: %s", key, value)
+        self.session_set_setting("send_socket_buffer_size", value)
+
+    def _on_set_recv_socket_buffer_size(self, key, value):
+        log.debug("%s: %s", key, value)
+        self.session_set_setting("recv_socket_buffer_size", value)
+
     def _on_auto_manage_prefer_seeds(self, key, value):
         log.debug("%s set to %s..", key, value)
         self.session_set_setting("auto_manage_prefer_seeds", value)
@@ -291,10 +291,11 @@ class DelugeRPCProtocol(DelugeTransferProtocol):
             finally:
                 return
 
-        if method in self.factory.methods and self.valid_session():
+        func = self.factory.methods.get(method)
+        if func is not None and self.valid_session():
             log.debug("RPC dispatch %s", method)
             try:
-                method_auth_requirement = self.factory.methods[method]._rpcserver_auth_level
+                method_auth_requirement = func._rpcserver_auth_level
                 auth_level = self.factory.authorized_sessions[self.transport.sessionno][0]
                 if auth_level < method_auth_requirement:
                     # This session is not allowed to call this method
@@ -304,7 +305,7 @@ class DelugeRPCProtocol(DelugeTransferProtocol):
                 # Set the session_id in the factory so that methods can know
                 # which session is calling it.
                 self.factory.session_id = self.transport.sessionno
-                ret = self.factory.methods[method](*args, **kwargs)
+                ret = func(*args, **kwargs)
             except Exception, e:
                 sendError()
                 # Don't bother printing out DelugeErrors, because they are just
@@ -507,15 +508,20 @@ class RPCServer(component.Component):
         :param event: the event to emit
         :type event: :class:`deluge.event.DelugeEvent`
         """
-        log.debug("intevents: %s", self.factory.interested_events)
+        debug = log.isEnabledFor(logging.DEBUG)
+        if debug:
+            log.debug("intevents: %s", self.factory.interested_events)
+        # The RPC_EVENT message is the same for every session, so only build
+        # it once
+        name = event.name
+        message = (RPC_EVENT, name, event.args)
         # Find sessions interested in this event
         for session_id, interest in self.factory.interested_events.iteritems():
-            if event.name in interest:
-                log.debug("Emit Event: %s %s", event.name, event.args)
+            if name in interest:
+                if debug:
+                    log.debug("Emit Event: %s %s", name, message[2])
                 # This session is interested so send a RPC_EVENT
-                self.factory.session_protocols[session_id].sendData(
-                    (RPC_EVENT, event.name, event.args)
-                )
+                self.factory.session_protocols[session_id].sendData(message)
 
     def emit_event_for_session_id(self, session_id, event):
         """
@@ -36,6 +36,8 @@
 
 import os
 import time
+import errno
+import socket
 import logging
 from urllib import unquote
 from urlparse import urlparse
@@ -49,8 +51,77 @@ from deluge.event import *
 
 TORRENT_STATE = deluge.common.TORRENT_STATE
 
+LTSTATE = deluge.common.LT_TORRENT_STATE
+
+# The torrent states for the libtorrent states, Queued and Checking are not in
+# here since they also depend on the torrent being paused
+LTSTATE_TO_STATE = {
+    LTSTATE["Downloading"]: "Downloading",
+    LTSTATE["Downloading Metadata"]: "Downloading",
+    LTSTATE["Finished"]: "Seeding",
+    LTSTATE["Seeding"]: "Seeding",
+    LTSTATE["Allocating"]: "Allocating"
+}
+
+# How long, in seconds, a libtorrent status is reused before asking the handle
+# for a new one
+STATUS_MAX_AGE = 0.25
+# How long after the TorrentManager's last state update the stored statuses are
+# trusted, these updates normally arrive every second.  Also the longest a
+# status is ever reused, as the updates leave out torrents whose only changes
+# are time based (active_time, next_announce, ...)
+STATUS_PUSH_MAX_AGE = 2
+# How long, in seconds, the piece states returned by get_pieces_info are reused
+PIECES_INFO_MAX_AGE = 1
+
 log = logging.getLogger(__name__)
 
+# Stands in for status keys missing from a previous status when diffing
+MISSING = object()
+
+# Second level domains that are kept along with the domain below them
+TRACKER_HOST_SLDS = frozenset(("co", "com", "net", "org"))
+TRACKER_HOST_TLDS = frozenset(("uk",))
+
+# Cache of tracker urls to host names, trackers are commonly shared by torrents
+tracker_hosts = {}
+
+def get_tracker_host(tracker):
+    """
+    Returns the short host name of a tracker url, eg. 'example.com' for
+    'http://tracker.example.com:80/announce'.
+
+    :param tracker: the tracker url
+    :type tracker: string
+
+    :returns: the host name, or an empty string if it can't be found
+    :rtype: string
+
+    """
+    if tracker in tracker_hosts:
+        return tracker_hosts[tracker]
+
+    url = urlparse(tracker.replace("udp://", "http://"))
+    if not hasattr(url, "hostname"):
+        return ""
+
+    host = (url.hostname or 'DHT')
+    # Check if hostname is an IP address and just return it if that's the case
+    try:
+        socket.inet_aton(host)
+    except socket.error:
+        parts = host.split(".")
+        if len(parts) > 2:
+            if parts[-2] in TRACKER_HOST_SLDS or parts[-1] in TRACKER_HOST_TLDS:
+                host = ".".join(parts[-3:])
+            else:
+                host = ".".join(parts[-2:])
+
+    if len(tracker_hosts) > 1000:
+        tracker_hosts.clear()
+    tracker_hosts[tracker] = host
+    return host
+
 def sanitize_filepath(filepath, folder=False):
     """
     Returns a sanitized filepath to pass to libotorrent rename_file().
@@ -58,18 +129,9 @@ def sanitize_filepath(filepath, folder=False):
     padding and duplicate slashes stripped. If `folder` is True a trailing
     slash is appended to the returned filepath.
     """
-    def clean_filename(filename):
-        filename = filename.strip()
-        if filename.replace('.', '') == '':
-            return ''
-        return filename
-
-    if '\\' in filepath or '/' in filepath:
-        folderpath = filepath.replace('\\', '/').split('/')
-        folderpath = [clean_filename(x) for x in folderpath]
-        newfilepath = '/'.join(filter(None, folderpath))
-    else:
-        newfilepath = clean_filename(filepath)
+    # Drop the empty and dots only components, ie. '', '.' and '..'
+    folderpath = [x.strip() for x in filepath.replace('\\', '/').split('/')]
+    newfilepath = '/'.join([x for x in folderpath if x.strip('.')])
 
     if folder is True:
         return newfilepath + '/'
@@ -77,27 +139,29 @@ def sanitize_filepath(filepath, folder=False):
         return newfilepath
 
 class TorrentOptions(dict):
+    # The core config keys the options default to
+    OPTIONS_CONF_MAP = {
+        "max_connections": "max_connections_per_torrent",
+        "max_upload_slots": "max_upload_slots_per_torrent",
+        "max_upload_speed": "max_upload_speed_per_torrent",
+        "max_download_speed": "max_download_speed_per_torrent",
+        "prioritize_first_last_pieces": "prioritize_first_last_pieces",
+        "sequential_download": "sequential_download",
+        "compact_allocation": "compact_allocation",
+        "download_location": "download_location",
+        "auto_managed": "auto_managed",
+        "stop_at_ratio": "stop_seed_at_ratio",
+        "stop_ratio": "stop_seed_ratio",
+        "remove_at_ratio": "remove_seed_at_ratio",
+        "move_completed": "move_completed",
+        "move_completed_path": "move_completed_path",
+        "add_paused": "add_paused",
+        "shared": "shared"
+    }
+
     def __init__(self):
         config = ConfigManager("core.conf").config
-        options_conf_map = {
-            "max_connections": "max_connections_per_torrent",
-            "max_upload_slots": "max_upload_slots_per_torrent",
-            "max_upload_speed": "max_upload_speed_per_torrent",
-            "max_download_speed": "max_download_speed_per_torrent",
-            "prioritize_first_last_pieces": "prioritize_first_last_pieces",
-            "sequential_download": "sequential_download",
-            "compact_allocation": "compact_allocation",
-            "download_location": "download_location",
-            "auto_managed": "auto_managed",
-            "stop_at_ratio": "stop_seed_at_ratio",
-            "stop_ratio": "stop_seed_ratio",
-            "remove_at_ratio": "remove_seed_at_ratio",
-            "move_completed": "move_completed",
-            "move_completed_path": "move_completed_path",
-            "add_paused": "add_paused",
-            "shared": "shared"
-        }
-        for opt_k, conf_k in options_conf_map.iteritems():
+        for opt_k, conf_k in self.OPTIONS_CONF_MAP.iteritems():
             self[opt_k] = config[conf_k]
         self["file_priorities"] = []
         self["mapped_files"] = {}
@@ -105,25 +169,117 @@ class TorrentOptions(dict):
 class Torrent(object):
     """Torrent holds information about torrents added to the libtorrent session.
     """
+    # The methods used for setting options
+    OPTIONS_FUNCS = {
+        "auto_managed": "set_auto_managed",
+        "download_location": "set_save_path",
+        "file_priorities": "set_file_priorities",
+        "max_connections": "set_max_connections",
+        "max_download_speed": "set_max_download_speed",
+        "max_upload_slots": "set_max_upload_slots",
+        "max_upload_speed": "set_max_upload_speed",
+        "prioritize_first_last_pieces": "set_prioritize_first_last",
+        "sequential_download": "set_sequential_download"
+    }
+
+    # Where each status key is read from, as (source, name) where source is one of:
+    #   "status": an attribute of the libtorrent torrent status
+    #   "option": a torrent option
+    #   "attr": an attribute of the torrent
+    #   "func": a torrent method computing the value
+    STATUS_SOURCES = {
+        "active_time": ("status", "active_time"),
+        "all_time_download": ("status", "all_time_download"),
+        "comment": ("func", "get_comment"),
+        "compact": ("option", "compact_allocation"),
+        "distributed_copies": ("func", "get_distributed_copies"),
+        "download_payload_rate": ("status", "download_payload_rate"),
+        "eta": ("func", "get_eta"),
+        "file_priorities": ("option", "file_priorities"),
+        "file_progress": ("func", "get_file_progress"),
+        "files": ("func", "get_files"),
+        "hash": ("attr", "torrent_id"),
+        "is_auto_managed": ("option", "auto_managed"),
+        "is_finished": ("attr", "is_finished"),
+        "is_seed": ("func", "get_is_seed"),
+        "last_seen_complete": ("func", "get_last_seen_complete"),
+        "max_connections": ("option", "max_connections"),
+        "max_download_speed": ("option", "max_download_speed"),
+        "max_upload_slots": ("option", "max_upload_slots"),
+        "max_upload_speed": ("option", "max_upload_speed"),
+        "message": ("attr", "statusmsg"),
+        "move_completed": ("option", "move_completed"),
+        "move_completed_path": ("option", "move_completed_path"),
+        "move_on_completed": ("option", "move_completed"),
+        "move_on_completed_path": ("option", "move_completed_path"),
+        "name": ("func", "get_name"),
+        "next_announce": ("func", "get_next_announce"),
+        "num_files": ("func", "get_num_files"),
+        "num_peers": ("func", "get_num_peers"),
+        "num_pieces": ("func", "get_num_pieces"),
+        "num_seeds": ("status", "num_seeds"),
+        "owner": ("attr", "owner"),
+        "paused": ("status", "paused"),
+        "peers": ("func", "get_peers"),
+        "piece_length": ("func", "get_piece_length"),
+        "pieces": ("func", "get_pieces_info"),
+        "prioritize_first_last": ("option", "prioritize_first_last_pieces"),
+        "private": ("func", "get_private"),
+        "progress": ("func", "get_progress"),
+        "queue": ("func", "get_queue_position"),
+        "ratio": ("func", "get_ratio"),
+        "remove_at_ratio": ("option", "remove_at_ratio"),
+        "save_path": ("option", "download_location"),
+        "seed_rank": ("status", "seed_rank"),
+        "seeding_time": ("status", "seeding_time"),
+        "seeds_peers_ratio": ("func", "get_seeds_peers_ratio"),
+        "sequential_download": ("option", "sequential_download"),
+        "shared": ("option", "shared"),
+        "state": ("attr", "state"),
+        "stop_at_ratio": ("option", "stop_at_ratio"),
+        "stop_ratio": ("option", "stop_ratio"),
+        "time_added": ("attr", "time_added"),
+        "total_done": ("status", "total_done"),
+        "total_payload_download": ("status", "total_payload_download"),
+        "total_payload_upload": ("status", "total_payload_upload"),
+        "total_peers": ("status", "num_incomplete"),
+        "total_seeds": ("status", "num_complete"),
+        "total_size": ("func", "get_total_size"),
+        "total_uploaded": ("status", "all_time_upload"),
+        "total_wanted": ("status", "total_wanted"),
+        "tracker": ("status", "current_tracker"),
+        "tracker_host": ("func", "get_tracker_host"),
+        "tracker_status": ("attr", "tracker_status"),
+        "trackers": ("attr", "trackers"),
+        "upload_payload_rate": ("status", "upload_payload_rate")
+    }
+
+    # All the status keys, returned when get_status() is given no keys
+    STATUS_KEYS = tuple(STATUS_SOURCES)
+
     def __init__(self, handle, options, state=None, filename=None, magnet=None, owner=None):
         log.debug("Creating torrent object %s", str(handle.info_hash()))
         # Get the core config
         self.config = ConfigManager("core.conf")
 
         self.rpcserver = component.get("RPCServer")
+        self.torrentmanager = component.get("TorrentManager")
 
         # This dict holds previous status dicts returned for this torrent
         # We use this to return dicts that only contain changes from the previous
         # {session_id: status_dict, ...}
+        # The TorrentManager periodically calls cleanup_prev_status() to drop
+        # the dicts of sessions that are gone
         self.prev_status = {}
-        from twisted.internet.task import LoopingCall
-        self.prev_status_cleanup_loop = LoopingCall(self.cleanup_prev_status)
-        self.prev_status_cleanup_loop.start(10)
 
         # Set the libtorrent handle
         self.handle = handle
         # Set the torrent_id for this torrent
-        self.torrent_id = str(handle.info_hash())
+        # Interned as the id is kept as a key in many dicts and sets
+        self.torrent_id = intern(str(handle.info_hash()))
+        # The path of the copy of the .torrent file kept in the state folder
+        self.torrentfile_path = os.path.join(
+            get_config_dir(), "state", self.torrent_id + ".torrent")
 
         # Let's us know if we're waiting on a lt alert
         self.waiting_on_resume_data = False
@@ -132,8 +288,11 @@ class Torrent(object):
         # This also includes the old_folder and new_folder to know what signal to send
         # This is so we can send one folder_renamed signal instead of multiple
         # file_renamed signals.
-        # [(old_folder, new_folder, [*indexes]), ...]
-        self.waiting_on_folder_rename = []
+        # Keyed by file index, each file of a folder rename maps to the same
+        # (old_folder, new_folder, set(*indexes still waiting on)) tuple.  A file
+        # can be part of several renames in a row, which complete in order.
+        # {index: [(old_folder, new_folder, set(*indexes)), ...], ...}
+        self.waiting_on_folder_rename = {}
 
         # We store the filename just in case we need to make a copy of the torrentfile
         if not filename:
@@ -144,15 +303,41 @@ class Torrent(object):
 
         # Store the magnet uri used to add this torrent if available
         self.magnet = magnet
+        # The display name in the magnet uri, used until the metadata arrives
+        self.magnet_name = None
+        if magnet:
+            try:
+                keys = dict([k.split('=') for k in magnet.split('?')[-1].split('&')])
+                name = keys.get('dn')
+                if name:
+                    name = unquote(name).replace('+', ' ')
+                    try:
+                        self.magnet_name = name.decode("utf8", "ignore")
+                    except UnicodeDecodeError:
+                        self.magnet_name = name
+            except:
+                pass
 
-        # Holds status info so that we don't need to keep getting it from lt
-        self.status = self.handle.status()
+        # Holds status info so that we don't need to keep getting it from lt,
+        # it is first fetched by update_state() below
+        self.status = None
+        self.status_time = 0
 
         try:
             self.torrent_info = self.handle.get_torrent_info()
         except RuntimeError:
             self.torrent_info = None
 
+        # The list returned by get_files() and the torrent_info it was built from
+        self.files_cache = None
+        self.files_cache_info = None
+        # The name returned by get_name() and the file list it was taken from
+        self.name_cache = None
+        self.name_cache_files = None
+        # The piece states returned by get_pieces_info() and when they were built
+        self.pieces_info_cache = None
+        self.pieces_info_time = 0
+
         # Default total_uploaded to 0, this may be changed by the state
         self.total_uploaded = 0
 
@@ -229,22 +414,9 @@ class Torrent(object):
 
     ## Options methods ##
     def set_options(self, options):
-        OPTIONS_FUNCS = {
-            # Functions used for setting options
-            "auto_managed": self.set_auto_managed,
-            "download_location": self.set_save_path,
-            "file_priorities": self.set_file_priorities,
-            "max_connections": self.handle.set_max_connections,
-            "max_download_speed": self.set_max_download_speed,
-            "max_upload_slots": self.handle.set_max_uploads,
-            "max_upload_speed": self.set_max_upload_speed,
-            "prioritize_first_last_pieces": self.set_prioritize_first_last,
-            "sequential_download": self.set_sequential_download
-
-        }
-        for (key, value) in options.items():
-            if OPTIONS_FUNCS.has_key(key):
-                OPTIONS_FUNCS[key](value)
+        for (key, value) in options.iteritems():
+            if key in self.OPTIONS_FUNCS:
+                getattr(self, self.OPTIONS_FUNCS[key])(value)
         self.options.update(options)
 
     def get_options(self):
@@ -252,26 +424,19 @@ class Torrent(object):
 
     def get_name(self):
         if self.handle.has_metadata():
-            name = self.torrent_info.file_at(0).path.split("/", 1)[0]
+            # The name only changes along with the file list, eg. on renames
+            files = self.get_files()
+            if files is self.name_cache_files:
+                return self.name_cache
+
+            name = files and files[0]["path"].split("/", 1)[0]
             if not name:
-                name = self.torrent_info.name()
-            try:
-                return name.decode("utf8", "ignore")
-            except UnicodeDecodeError:
-                return name
-        elif self.magnet:
-            try:
-                keys = dict([k.split('=') for k in self.magnet.split('?')[-1].split('&')])
-                name = keys.get('dn')
-                if not name:
-                    return self.torrent_id
-                name = unquote(name).replace('+', ' ')
-                try:
-                    return name.decode("utf8", "ignore")
-                except UnicodeDecodeError:
-                    return name
-            except:
-                pass
+                name = self.torrent_info.name().decode("utf8", "ignore")
+            self.name_cache = name
+            self.name_cache_files = files
+            return name
+        elif self.magnet_name:
+            return self.magnet_name
         return self.torrent_id
 
     def set_owner(self, account):
@@ -310,19 +475,22 @@ class Torrent(object):
                           "allocation does not work!")
                 return
 
-            paths = {}
             ti = self.handle.get_torrent_info()
-            for n in range(ti.num_pieces()):
-                slices = ti.map_block(n, 0, ti.piece_size(n))
-                for slice in slices:
-                    fe = ti.file_at(slice.file_index)
-                    paths.setdefault(fe.path, []).append(n)
-
+            piece_length = ti.piece_length()
+            priority = prioritize and 7 or 1
             priorities = self.handle.piece_priorities()
-            for pieces in paths.itervalues():
-                two_percent = 2*100/len(pieces)
-                for piece in pieces[:two_percent]+pieces[-two_percent:]:
-                    priorities[piece] = prioritize and 7 or 1
+            for index in xrange(ti.num_files()):
+                f = ti.file_at(index)
+                if not f.size:
+                    continue
+                # The range of pieces holding this file
+                first_piece = f.offset / piece_length
+                last_piece = (f.offset + f.size - 1) / piece_length
+                two_percent = max(1, (last_piece - first_piece + 1) * 2 / 100)
+                for piece in xrange(first_piece, first_piece + two_percent):
+                    priorities[piece] = priority
+                for piece in xrange(last_piece - two_percent + 1, last_piece + 1):
+                    priorities[piece] = priority
             self.handle.prioritize_pieces(priorities)
 
     def set_sequential_download(self, set_sequencial):
@@ -368,8 +536,8 @@ class Torrent(object):
         if 0 in self.options["file_priorities"]:
             # We have previously marked a file 'Do Not Download'
             # Check to see if we have changed any 0's to >0 and change state accordingly
-            for index, priority in enumerate(self.options["file_priorities"]):
-                if priority == 0 and file_priorities[index] > 0:
+            for priority, new_priority in zip(self.options["file_priorities"], file_priorities):
+                if priority == 0 and new_priority > 0:
                     # We have a changed 'Do Not Download' to a download priority
                     self.is_finished = False
                     self.update_state()
@@ -424,11 +592,44 @@ class Torrent(object):
         """Sets the tracker status"""
         self.tracker_status = self.get_tracker_host() + ": " + status
 
+    def update_status(self, status=None):
+        """
+        Updates the cached libtorrent status of the torrent.
+
+        :param status: the new status, if None it is fetched from the handle
+        :type status: libtorrent torrent_status
+
+        :returns: the new status
+        :rtype: libtorrent torrent_status
+
+        """
+        if status is None:
+            status = self.handle.status()
+        self.status = status
+        self.status_time = time.time()
+        return status
+
+    def get_lt_status(self):
+        """
+        Returns the cached libtorrent status, fetching a new one from the
+        handle if it is older than STATUS_MAX_AGE.  While the TorrentManager
+        receives state updates the cached status is kept for up to
+        STATUS_PUSH_MAX_AGE instead, as state changes would have been pushed.
+        """
+        age = time.time() - self.status_time
+        if age > STATUS_PUSH_MAX_AGE or (age > STATUS_MAX_AGE and
+                time.time() - self.torrentmanager.last_state_update > STATUS_PUSH_MAX_AGE):
+            return self.update_status()
+        return self.status
+
     def update_state(self):
         """Updates the state based on what libtorrent's state for the torrent is"""
+        # The state has likely just changed, so always get a fresh status
+        status = self.update_status()
+        self.pieces_info_time = 0
+
         # Set the initial state based on the lt state
-        LTSTATE = deluge.common.LT_TORRENT_STATE
-        ltstate = int(self.handle.status().state)
+        ltstate = int(status.state)
 
         # Set self.state to the ltstate right away just incase we don't hit some
         # of the logic below
@@ -437,35 +638,36 @@ class Torrent(object):
         else:
             self.state = str(ltstate)
 
-        log.debug("set_state_based_on_ltstate: %s", deluge.common.LT_TORRENT_STATE[ltstate])
-        log.debug("session.is_paused: %s", component.get("Core").session.is_paused())
+        session_paused = component.get("Core").session.is_paused()
+        log.debug("set_state_based_on_ltstate: %s", self.state)
+        log.debug("session.is_paused: %s", session_paused)
+
+        paused = self.handle.is_paused()
 
         # First we check for an error from libtorrent, and set the state to that
         # if any occurred.
-        if len(self.handle.status().error) > 0:
+        if len(status.error) > 0:
             # This is an error'd torrent
             self.state = "Error"
-            self.set_status_message(self.handle.status().error)
-            if self.handle.is_paused():
+            self.set_status_message(status.error)
+            if paused:
                 self.handle.auto_managed(False)
             return
 
         if ltstate == LTSTATE["Queued"] or ltstate == LTSTATE["Checking"]:
-            if self.handle.is_paused():
+            if paused:
                 self.state = "Paused"
             else:
                 self.state = "Checking"
             return
-        elif ltstate == LTSTATE["Downloading"] or ltstate == LTSTATE["Downloading Metadata"]:
-            self.state = "Downloading"
-        elif ltstate == LTSTATE["Finished"] or ltstate == LTSTATE["Seeding"]:
-            self.state = "Seeding"
-        elif ltstate == LTSTATE["Allocating"]:
-            self.state = "Allocating"
-
-        if self.handle.is_paused() and self.handle.is_auto_managed() and not component.get("Core").session.is_paused():
+        elif ltstate in LTSTATE_TO_STATE:
+            self.state = LTSTATE_TO_STATE[ltstate]
+
+        # Paused torrents that are auto managed are waiting in the queue
+        queued = paused and self.handle.is_auto_managed()
+        if queued and not session_paused:
             self.state = "Queued"
-        elif component.get("Core").session.is_paused() or (self.handle.is_paused() and not self.handle.is_auto_managed()):
+        elif session_paused or (paused and not queued):
             self.state = "Paused"
 
     def set_state(self, state):
@@ -482,10 +684,7 @@ class Torrent(object):
 
     def get_eta(self):
         """Returns the ETA in seconds for this torrent"""
-        if self.status == None:
-            status = self.handle.status()
-        else:
-            status = self.status
+        status = self.get_lt_status()
 
         if self.is_finished and self.options["stop_at_ratio"]:
             # We're a seed, so calculate the time to the 'stop_share_ratio'
@@ -508,10 +707,7 @@ class Torrent(object):
 
     def get_ratio(self):
         """Returns the ratio for this torrent"""
-        if self.status == None:
-            status = self.handle.status()
-        else:
-            status = self.status
+        status = self.get_lt_status()
 
         if status.total_done > 0:
             # We use 'total_done' if the downloaded value is 0
@@ -524,14 +720,16 @@ class Torrent(object):
 
     def get_files(self):
         """Returns a list of files this torrent contains"""
-        if self.torrent_info == None and self.handle.has_metadata():
-            torrent_info = self.handle.get_torrent_info()
-        else:
-            torrent_info = self.torrent_info
+        if self.torrent_info is None and self.handle.has_metadata():
+            self.torrent_info = self.handle.get_torrent_info()
+        torrent_info = self.torrent_info
 
         if not torrent_info:
             return []
 
+        if torrent_info is self.files_cache_info:
+            return self.files_cache
+
         ret = []
         files = torrent_info.files()
         for index, file in enumerate(files):
@@ -541,29 +739,30 @@ class Torrent(object):
                 'size': file.size,
                 'offset': file.offset
             })
+        self.files_cache = ret
+        self.files_cache_info = torrent_info
         return ret
 
     def get_peers(self):
         """Returns a list of peers and various information about them"""
         ret = []
         peers = self.handle.get_peer_info()
+        # We do not want to report peers that are half-connected
+        half_connected = lt.peer_info.connecting | lt.peer_info.handshake
 
         for peer in peers:
-            # We do not want to report peers that are half-connected
-            if peer.flags & peer.connecting or peer.flags & peer.handshake:
+            if peer.flags & half_connected:
                 continue
+            client = str(peer.client)
             try:
-                client = str(peer.client).decode("utf-8")
+                client = client.decode("utf-8")
             except UnicodeDecodeError:
-                client = str(peer.client).decode("latin-1")
+                client = client.decode("latin-1")
 
             # Make country a proper string
-            country = str()
-            for c in peer.country:
-                if not c.isalpha():
-                    country += " "
-                else:
-                    country += c
+            country = peer.country
+            if not country.isalpha():
+                country = "".join([c if c.isalpha() else " " for c in country])
 
             ret.append({
                 "client": client,
@@ -587,14 +786,8 @@ class Torrent(object):
             return 0.0
 
         file_progress = self.handle.file_progress()
-        ret = []
-        for i,f in enumerate(self.get_files()):
-            try:
-                ret.append(float(file_progress[i]) / float(f["size"]))
-            except ZeroDivisionError:
-                ret.append(0.0)
-
-        return ret
+        return [f["size"] and float(progress) / f["size"] or 0.0
+                for progress, f in zip(file_progress, self.get_files())]
 
     def get_tracker_host(self):
         """Returns just the hostname of the currently connected tracker
@@ -602,35 +795,13 @@ class Torrent(object):
         if self.tracker_host:
             return self.tracker_host
 
-        if not self.status:
-            self.status = self.handle.status()
-
-        tracker = self.status.current_tracker
+        tracker = self.get_lt_status().current_tracker
         if not tracker and self.trackers:
             tracker = self.trackers[0]["url"]
 
         if tracker:
-            url = urlparse(tracker.replace("udp://", "http://"))
-            if hasattr(url, "hostname"):
-                host = (url.hostname or 'DHT')
-                # Check if hostname is an IP address and just return it if that's the case
-                import socket
-                try:
-                    socket.inet_aton(host)
-                except socket.error:
-                    pass
-                else:
-                    # This is an IP address because an exception wasn't raised
-                    return url.hostname
-
-                parts = host.split(".")
-                if len(parts) > 2:
-                    if parts[-2] in ("co", "com", "net", "org") or parts[-1] in ("uk"):
-                        host = ".".join(parts[-3:])
-                    else:
-                        host = ".".join(parts[-2:])
-                self.tracker_host = host
-                return host
+            self.tracker_host = get_tracker_host(tracker)
+            return self.tracker_host
         return ""
 
     def get_last_seen_complete(self):
@@ -639,10 +810,73 @@ class Torrent(object):
         available.
         """
         if lt.version_minor > 15:
-            return self.status.last_seen_complete
+            return self.get_lt_status().last_seen_complete
         self.calculate_last_seen_complete()
         return self._last_seen_complete
 
+    def get_progress(self):
+        """Returns the progress of the torrent as a 0-100 value"""
+        return self.get_lt_status().progress * 100
+
+    def get_distributed_copies(self):
+        """Returns the distributed copies, adjusted to be non-negative"""
+        distributed_copies = self.get_lt_status().distributed_copies
+        if distributed_copies < 0:
+            return 0.0
+        return distributed_copies
+
+    def get_seeds_peers_ratio(self):
+        """Returns the seeds:peers ratio, -1.0 signifies infinity"""
+        status = self.get_lt_status()
+        if status.num_incomplete == 0:
+            return -1.0
+        return status.num_complete / float(status.num_incomplete)
+
+    def get_num_peers(self):
+        """Returns the number of connected peers that aren't seeds"""
+        status = self.get_lt_status()
+        return status.num_peers - status.num_seeds
+
+    def get_next_announce(self):
+        """Returns the seconds until the next announce"""
+        return self.get_lt_status().next_announce.seconds
+
+    def get_is_seed(self):
+        return self.handle.is_seed()
+
+    def get_comment(self):
+        if self.handle.has_metadata():
+            try:
+                return self.torrent_info.comment().decode("utf8", "ignore")
+            except UnicodeDecodeError:
+                return self.torrent_info.comment()
+        return ""
+
+    def get_private(self):
+        if self.handle.has_metadata():
+            return self.torrent_info.priv()
+        return False
+
+    def get_total_size(self):
+        if self.handle.has_metadata():
+            return self.torrent_info.total_size()
+        return 0
+
+    def get_num_files(self):
+        if self.handle.has_metadata():
+            return self.torrent_info.num_files()
+        return 0
+
+    def get_num_pieces(self):
+        if self.handle.has_metadata():
+            return self.torrent_info.num_pieces()
+        return 0
+
+    def get_piece_length(self):
+        if self.handle.has_metadata():
+            return self.torrent_info.piece_length()
+        return 0
+
     def get_status(self, keys, diff=False):
         """
         Returns the status of the torrent based on the keys provided
@@ -658,178 +892,57 @@ class Torrent(object):
 
         """
 
-        # Create the full dictionary
-        self.status = self.handle.status()
-        if self.handle.has_metadata():
+        status = self.get_lt_status()
+        # The torrent_info is a reference to libtorrent's own, so it only needs
+        # to be fetched once the metadata is available
+        if self.torrent_info is None and self.handle.has_metadata():
             self.torrent_info = self.handle.get_torrent_info()
 
-        # Adjust progress to be 0-100 value
-        progress = self.status.progress * 100
-
-        # Adjust status.distributed_copies to return a non-negative value
-        distributed_copies = self.status.distributed_copies
-        if distributed_copies < 0:
-            distributed_copies = 0.0
-
-        # Calculate the seeds:peers ratio
-        if self.status.num_incomplete == 0:
-            # Use -1.0 to signify infinity
-            seeds_peers_ratio = -1.0
-        else:
-            seeds_peers_ratio = self.status.num_complete / float(self.status.num_incomplete)
-
-        full_status = {
-            "active_time": self.status.active_time,
-            "all_time_download": self.status.all_time_download,
-            "compact": self.options["compact_allocation"],
-            "distributed_copies": distributed_copies,
-            "download_payload_rate": self.status.download_payload_rate,
-            "file_priorities": self.options["file_priorities"],
-            "hash": self.torrent_id,
-            "is_auto_managed": self.options["auto_managed"],
-            "is_finished": self.is_finished,
-            "max_connections": self.options["max_connections"],
-            "max_download_speed": self.options["max_download_speed"],
-            "max_upload_slots": self.options["max_upload_slots"],
-            "max_upload_speed": self.options["max_upload_speed"],
-            "message": self.statusmsg,
-            "move_on_completed_path": self.options["move_completed_path"],
-            "move_on_completed": self.options["move_completed"],
-            "move_completed_path": self.options["move_completed_path"],
-            "move_completed": self.options["move_completed"],
-            "next_announce": self.status.next_announce.seconds,
-            "num_peers": self.status.num_peers - self.status.num_seeds,
-            "num_seeds": self.status.num_seeds,
-            "owner": self.owner,
-            "paused": self.status.paused,
-            "prioritize_first_last": self.options["prioritize_first_last_pieces"],
-            "sequential_download": self.options["sequential_download"],
-            "progress": progress,
-            "shared": self.options["shared"],
-            "remove_at_ratio": self.options["remove_at_ratio"],
-            "save_path": self.options["download_location"],
-            "seeding_time": self.status.seeding_time,
-            "seeds_peers_ratio": seeds_peers_ratio,
-            "seed_rank": self.status.seed_rank,
-            "state": self.state,
-            "stop_at_ratio": self.options["stop_at_ratio"],
-            "stop_ratio": self.options["stop_ratio"],
-            "time_added": self.time_added,
-            "total_done": self.status.total_done,
-            "total_payload_download": self.status.total_payload_download,
-            "total_payload_upload": self.status.total_payload_upload,
-            "total_peers": self.status.num_incomplete,
-            "total_seeds":  self.status.num_complete,
-            "total_uploaded": self.status.all_time_upload,
-            "total_wanted": self.status.total_wanted,
-            "tracker": self.status.current_tracker,
-            "trackers": self.trackers,
-            "tracker_status": self.tracker_status,
-            "upload_payload_rate": self.status.upload_payload_rate
-        }
-
-        def ti_comment():
-            if self.handle.has_metadata():
-                try:
-                    return self.torrent_info.comment().decode("utf8", "ignore")
-                except UnicodeDecodeError:
-                    return self.torrent_info.comment()
-            return ""
-
-        def ti_priv():
-            if self.handle.has_metadata():
-                return self.torrent_info.priv()
-            return False
-        def ti_total_size():
-            if self.handle.has_metadata():
-                return self.torrent_info.total_size()
-            return 0
-        def ti_num_files():
-            if self.handle.has_metadata():
-                return self.torrent_info.num_files()
-            return 0
-        def ti_num_pieces():
-            if self.handle.has_metadata():
-                return self.torrent_info.num_pieces()
-            return 0
-        def ti_piece_length():
-            if self.handle.has_metadata():
-                return self.torrent_info.piece_length()
-            return 0
-        def ti_pieces_info():
-            if self.handle.has_metadata():
-                return self.get_pieces_info()
-            return None
+        if not keys:
+            keys = self.STATUS_KEYS
 
-        fns = {
-            "comment": ti_comment,
-            "eta": self.get_eta,
-            "file_progress": self.get_file_progress,
-            "files": self.get_files,
-            "is_seed": self.handle.is_seed,
-            "name": self.get_name,
-            "num_files": ti_num_files,
-            "num_pieces": ti_num_pieces,
-            "pieces": ti_pieces_info,
-            "peers": self.get_peers,
-            "piece_length": ti_piece_length,
-            "private": ti_priv,
-            "queue": self.handle.queue_position,
-            "ratio": self.get_ratio,
-            "total_size": ti_total_size,
-            "tracker_host": self.get_tracker_host,
-            "last_seen_complete": self.get_last_seen_complete
-        }
-
-        # Create the desired status dictionary and return it
+        # Create the desired status dictionary, only looking up the requested
+        # keys in their source
         status_dict = {}
+        for key in keys:
+            if key not in self.STATUS_SOURCES:
+                continue
+            source, name = self.STATUS_SOURCES[key]
+            if source == "status":
+                status_dict[key] = getattr(status, name)
+            elif source == "option":
+                status_dict[key] = self.options[name]
+            elif source == "attr":
+                status_dict[key] = getattr(self, name)
+            else:
+                status_dict[key] = getattr(self, name)()
 
-        if len(keys) == 0:
-            status_dict = full_status
-            for key in fns:
-                status_dict[key] = fns[key]()
-        else:
-            for key in keys:
-                if key in full_status:
-                    status_dict[key] = full_status[key]
-                elif key in fns:
-                    status_dict[key] = fns[key]()
-
-        session_id = self.rpcserver.get_session_id()
         if diff:
-            if session_id in self.prev_status:
-                # We have a previous status dict, so lets make a diff
-                status_diff = {}
-                for key, value in status_dict.items():
-                    if key in self.prev_status[session_id]:
-                        if value != self.prev_status[session_id][key]:
-                            status_diff[key] = value
-                    else:
-                        status_diff[key] = value
-
-                self.prev_status[session_id] = status_dict
-                return status_diff
-
+            session_id = self.rpcserver.get_session_id()
+            prev_status = self.prev_status.get(session_id)
             self.prev_status[session_id] = status_dict
+            if prev_status is not None:
+                # Comparing the whole dicts is done in C, so check that first
+                # as nothing has changed between most polls
+                if status_dict == prev_status:
+                    return {}
+                # We have a previous status dict, so lets make a diff
+                return dict((key, value) for key, value in status_dict.iteritems()
+                            if prev_status.get(key, MISSING) != value)
             return status_dict
 
         return status_dict
 
-    def apply_options(self):
-        """Applies the per-torrent options that are set."""
-        self.handle.set_max_connections(self.max_connections)
-        self.handle.set_max_uploads(self.max_upload_slots)
-        self.handle.set_upload_limit(int(self.max_upload_speed * 1024))
-        self.handle.set_download_limit(int(self.max_download_speed * 1024))
-        self.handle.prioritize_files(self.file_priorities)
-        self.handle.set_sequential_download(self.options["sequential_download"])
-        self.handle.resolve_countries(True)
-
     def pause(self):
         """Pause this torrent"""
+        paused = self.handle.is_paused()
+        if paused and not self.handle.is_auto_managed():
+            # The torrent is already paused and lt queueing won't resume it
+            return True
+
         # Turn off auto-management so the torrent will not be unpaused by lt queueing
         self.handle.auto_managed(False)
-        if self.handle.is_paused():
+        if paused:
             # This torrent was probably paused due to being auto managed by lt
             # Since we turned auto_managed off, we should update the state which should
             # show it as 'Paused'.  We need to emit a torrent_paused signal because
@@ -869,8 +982,8 @@ class Torrent(object):
 
             try:
                 self.handle.resume()
-            except:
-                pass
+            except Exception, e:
+                log.debug("Unable to resume torrent: %s", e)
 
             return True
 
@@ -896,12 +1009,12 @@ class Torrent(object):
                 dest_u = dest
         else:
             dest_u = dest
-            
-        if not os.path.exists(dest_u):
-            try:
-                # Try to make the destination path if it doesn't exist
-                os.makedirs(dest_u)
-            except IOError, e:
+
+        try:
+            # Try to make the destination path in case it doesn't exist
+            os.makedirs(dest_u)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
                 log.exception(e)
                 log.error("Could not move storage for torrent %s since %s does "
                           "not exist and could not create the directory.",
@@ -909,7 +1022,8 @@ class Torrent(object):
                 return False
         try:
             self.handle.move_storage(dest_u)
-        except:
+        except Exception, e:
+            log.error("Error calling libtorrent move_storage: %s", e)
             return False
 
         return True
@@ -922,30 +1036,27 @@ class Torrent(object):
 
     def write_torrentfile(self):
         """Writes the torrent file"""
-        path = "%s/%s.torrent" % (
-            os.path.join(get_config_dir(), "state"),
-            self.torrent_id)
+        path = self.torrentfile_path
         log.debug("Writing torrent file: %s", path)
         try:
             self.torrent_info = self.handle.get_torrent_info()
             # Regenerate the file priorities
             self.set_file_priorities([])
-            md = lt.bdecode(self.torrent_info.metadata())
-            torrent_file = {}
-            torrent_file["info"] = md
-            open(path, "wb").write(lt.bencode(torrent_file))
+            # The metadata is the already bencoded info dict, so just wrap it
+            # in the torrent file dict instead of decoding and re-encoding it
+            _file = open(path, "wb")
+            _file.write("d4:info" + self.torrent_info.metadata() + "e")
+            _file.close()
         except Exception, e:
             log.warning("Unable to save torrent file: %s", e)
 
     def delete_torrentfile(self):
         """Deletes the .torrent file in the state"""
-        path = "%s/%s.torrent" % (
-            os.path.join(get_config_dir(), "state"),
-            self.torrent_id)
+        path = self.torrentfile_path
         log.debug("Deleting torrent file: %s", path)
         try:
             os.remove(path)
-        except Exception, e:
+        except OSError, e:
             log.warning("Unable to delete the torrent file: %s", e)
 
     def force_reannounce(self):
@@ -984,9 +1095,9 @@ class Torrent(object):
     def rename_files(self, filenames):
         """Renames files in the torrent. 'filenames' should be a list of
         (index, filename) pairs."""
+        rename_file = self.handle.rename_file
         for index, filename in filenames:
-            filename = sanitize_filepath(filename)
-            self.handle.rename_file(index, filename.encode("utf-8"))
+            rename_file(index, sanitize_filepath(filename).encode("utf-8"))
 
     def rename_folder(self, folder, new_folder):
         """Renames a folder within a torrent.  This basically does a file rename
@@ -998,23 +1109,34 @@ class Torrent(object):
 
         new_folder = sanitize_filepath(new_folder, folder=True)
 
-        wait_on_folder = (folder, new_folder, [])
+        wait_on_folder = (folder, new_folder, set())
+        folder_len = len(folder)
+        # Only the part of the path under the folder needs encoding per file
+        new_folder_utf8 = new_folder.encode("utf-8")
+        rename_file = self.handle.rename_file
         for f in self.get_files():
-            if f["path"].startswith(folder):
+            path = f["path"]
+            if path.startswith(folder):
                 # Keep a list of filerenames we're waiting on
-                wait_on_folder[2].append(f["index"])
-                self.handle.rename_file(f["index"], f["path"].replace(folder, new_folder, 1).encode("utf-8"))
-        self.waiting_on_folder_rename.append(wait_on_folder)
+                wait_on_folder[2].add(f["index"])
+                self.waiting_on_folder_rename.setdefault(
+                    f["index"], []).append(wait_on_folder)
+                rename_file(f["index"], new_folder_utf8 + path[folder_len:].encode("utf-8"))
 
     def cleanup_prev_status(self):
         """
         This method gets called to check the validity of the keys in the prev_status
-        dict.  If the key is no longer valid, the dict will be deleted.
+        dict.  If the key is no longer valid, the dict will be deleted.  Stale
+        piece states from get_pieces_info() are dropped as well.
 
         """
-        for key in self.prev_status.keys():
-            if not self.rpcserver.is_session_valid(key):
-                del self.prev_status[key]
+        is_session_valid = self.rpcserver.is_session_valid
+        for key in [key for key in self.prev_status if not is_session_valid(key)]:
+            del self.prev_status[key]
+
+        # Don't hold on to the piece states once they can't be reused
+        if time.time() - self.pieces_info_time >= PIECES_INFO_MAX_AGE:
+            self.pieces_info_cache = None
 
     def calculate_last_seen_complete(self):
         if self._last_seen_complete+60 > time.time():
@@ -1022,7 +1144,7 @@ class Torrent(object):
             return self._last_seen_complete
 
         availability = self.handle.piece_availability()
-        if filter(lambda x: x<1, availability):
+        if 0 in availability:
             # Torrent does not have all the pieces
             return
         log.trace("Torrent %s has all the pieces. Setting last seen complete.",
@@ -1030,37 +1152,31 @@ class Torrent(object):
         self._last_seen_complete = time.time()
 
     def get_pieces_info(self):
-        pieces = {}
+        if not self.handle.has_metadata():
+            return None
+
+        if time.time() - self.pieces_info_time < PIECES_INFO_MAX_AGE:
+            return self.pieces_info_cache
+
         # First get the pieces availability.
         availability = self.handle.piece_availability()
-        # Pieces from connected peers
+        # Completed pieces are 3, pieces available from peers 1, and missing
+        # pieces 0, ie, there's no known peer with the piece, or it has not
+        # been asked for so far. The availability is only looked at for the
+        # pieces we don't have as it is empty for seeds.
+        pieces = [3 if piece else 1 if availability[idx] > 0 else 0
+                  for idx, piece in enumerate(self.get_lt_status().pieces)]
+
+        # Pieces being downloaded from connected peers
+        num_pieces = len(pieces)
         for peer_info in self.handle.get_peer_info():
-            if peer_info.downloading_piece_index < 0:
+            index = peer_info.downloading_piece_index
+            if index < 0 or index >= num_pieces:
                 # No piece index, then we're not downloading anything from
-                # this peer
+                # this peer, or the status has no pieces yet (eg. checking)
                 continue
-            pieces[peer_info.downloading_piece_index] = 2
+            pieces[index] = 2
 
-        # Now, the rest of the pieces
-        for idx, piece in enumerate(self.handle.status().pieces):
-            if idx in pieces:
-                # Piece beeing downloaded, handled above
-                continue
-            elif piece:
-                # Completed Piece
-                pieces[idx] = 3
-                continue
-            elif availability[idx] > 0:
-                # Piece not downloaded nor beeing downloaded but available
-                pieces[idx] = 1
-                continue
-            # If we reached here, it means the piece is missing, ie, there's
-            # no known peer with this piece, or this piece has not been asked
-            # for so far.
-            pieces[idx] = 0
-
-        sorted_indexes = pieces.keys()
-        sorted_indexes.sort()
-        # Return only the piece states, no need for the piece index
-        # Keep the order
-        return [pieces[idx] for idx in sorted_indexes]
+        self.pieces_info_cache = pieces
+        self.pieces_info_time = time.time()
+        return pieces
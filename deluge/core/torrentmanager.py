@@ -42,8 +42,10 @@ import time
 import shutil
 import operator
 import logging
-import re
+from errno import ENOTEMPTY
+from hashlib import sha1
 
+from twisted.internet import reactor
 from twisted.internet.task import LoopingCall
 
 from deluge._libtorrent import lt
@@ -56,10 +58,70 @@ from deluge.core.authmanager import AUTH_LEVEL_ADMIN
 from deluge.core.torrent import Torrent
 from deluge.core.torrent import TorrentOptions
 import deluge.core.oldstateupgrader
-from deluge.common import utf8_encoded
+from deluge.common import utf8_encoded, windows_check
 
 log = logging.getLogger(__name__)
 
+# fdatasync skips flushing unchanged file metadata, where it is available
+fdatasync = getattr(os, "fdatasync", os.fsync)
+
+# Torrents in these states are never stopped at their ratio
+STOP_AT_RATIO_SKIP_STATES = frozenset(("Checking", "Allocating", "Paused",
+                                       "Queued"))
+
+# Torrents entering these states may still need to download data
+UNFINISHED_STATES = frozenset(("Checking", "Checking Resume Data",
+                               "Downloading"))
+
+def read_file(path):
+    """
+    Reads the whole of a file with os.read(), sizing the read from fstat()
+    so the data comes back in one call rather than through stdio buffers.
+
+    :param path: the path of the file to read
+    :type path: string
+
+    :returns: the contents of the file
+    :rtype: string
+
+    :raises OSError: if the file cannot be opened or read
+
+    """
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        size = os.fstat(fd).st_size
+        chunks = []
+        while True:
+            # Keep reading past the fstat() size in case the file has grown
+            chunk = os.read(fd, max(size, 65536))
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return "".join(chunks)
+    finally:
+        os.close(fd)
+
+def write_file(path, data):
+    """
+    Writes data to a file with os.write(), replacing any existing contents.
+
+    :param path: the path of the file to write
+    :type path: string
+    :param data: the data to write
+    :type data: string
+
+    :raises OSError: if the file cannot be opened or written
+
+    """
+    # New files get the same permissions open() would give them
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC |
+                 getattr(os, "O_BINARY", 0), 0666)
+    try:
+        while data:
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
+
 class TorrentState:
     def __init__(self,
             torrent_id=None,
@@ -143,8 +205,14 @@ class TorrentManager(component.Component):
         self.config = ConfigManager("core.conf")
 
         # Make sure the state folder has been created
-        if not os.path.exists(os.path.join(get_config_dir(), "state")):
-            os.makedirs(os.path.join(get_config_dir(), "state"))
+        self.state_dir = os.path.join(get_config_dir(), "state")
+        if not os.path.exists(self.state_dir):
+            os.makedirs(self.state_dir)
+        self.state_path = os.path.join(self.state_dir, "torrents.state")
+        self.state_new_path = self.state_path + ".new"
+        self.fastresume_path = os.path.join(self.state_dir,
+                                            "torrents.fastresume")
+        self.fastresume_new_path = self.fastresume_path + ".new"
 
         # Create the torrents dict { torrent_id: Torrent }
         self.torrents = {}
@@ -156,12 +224,26 @@ class TorrentManager(component.Component):
         # and that their resume data has been written.
         self.shutdown_torrent_pause_list = []
 
+        # The delayed call saving the state after torrents are added or removed
+        self.save_state_call = None
+
+        # The digest of the last state written, to skip unchanged saves
+        self.state_digest = None
+
         # self.num_resume_data used to save resume_data in bulk
         self.num_resume_data = 0
 
+        # The torrents waiting for the delayed call saving their resume data
+        self.pending_resume_data = set()
+        self.save_resume_data_call = None
+
         # Keeps track of resume data that needs to be saved to disk
         self.resume_data = {}
 
+        # When the last state_update_alert arrived, the torrents it left out
+        # have not changed since their status was last stored
+        self.last_state_update = 0
+
         # Register set functions
         self.config.register_set_function("max_connections_per_torrent",
             self.on_set_max_connections_per_torrent)
@@ -172,44 +254,27 @@ class TorrentManager(component.Component):
         self.config.register_set_function("max_download_speed_per_torrent",
             self.on_set_max_download_speed_per_torrent)
 
-        # Register alert functions
-        self.alerts.register_handler("torrent_finished_alert",
-            self.on_alert_torrent_finished)
-        self.alerts.register_handler("torrent_paused_alert",
-            self.on_alert_torrent_paused)
-        self.alerts.register_handler("torrent_checked_alert",
-            self.on_alert_torrent_checked)
-        self.alerts.register_handler("tracker_reply_alert",
-            self.on_alert_tracker_reply)
-        self.alerts.register_handler("tracker_announce_alert",
-            self.on_alert_tracker_announce)
-        self.alerts.register_handler("tracker_warning_alert",
-            self.on_alert_tracker_warning)
-        self.alerts.register_handler("tracker_error_alert",
-            self.on_alert_tracker_error)
-        self.alerts.register_handler("storage_moved_alert",
-            self.on_alert_storage_moved)
-        self.alerts.register_handler("torrent_resumed_alert",
-            self.on_alert_torrent_resumed)
-        self.alerts.register_handler("state_changed_alert",
-            self.on_alert_state_changed)
-        self.alerts.register_handler("save_resume_data_alert",
-            self.on_alert_save_resume_data)
-        self.alerts.register_handler("save_resume_data_failed_alert",
-            self.on_alert_save_resume_data_failed)
-        self.alerts.register_handler("file_renamed_alert",
-            self.on_alert_file_renamed)
-        self.alerts.register_handler("metadata_received_alert",
-            self.on_alert_metadata_received)
-        self.alerts.register_handler("file_error_alert",
-            self.on_alert_file_error)
-        self.alerts.register_handler("file_completed_alert",
-            self.on_alert_file_completed)
+        # Register alert functions, each alert is handled by on_alert_<name>
+        for name in ("torrent_finished", "torrent_paused", "torrent_checked",
+                     "tracker_reply", "tracker_announce", "tracker_warning",
+                     "tracker_error", "storage_moved", "torrent_resumed",
+                     "state_changed", "save_resume_data",
+                     "save_resume_data_failed", "file_renamed",
+                     "metadata_received", "file_error", "file_completed",
+                     "state_update"):
+            self.alerts.register_handler(name + "_alert",
+                getattr(self, "on_alert_" + name))
 
     def start(self):
         # Get the pluginmanager reference
         self.plugins = component.get("CorePluginManager")
 
+        # Keep references to the components used when adding and removing
+        # torrents and handling alerts
+        self.rpcserver = component.get("RPCServer")
+        self.eventmanager = component.get("EventManager")
+        self.authmanager = component.get("AuthManager")
+
         # Run the old state upgrader before loading state
         deluge.core.oldstateupgrader.OldStateUpgrader()
 
@@ -221,74 +286,128 @@ class TorrentManager(component.Component):
         self.save_state_timer.start(200, False)
         self.save_resume_data_timer = LoopingCall(self.save_resume_data)
         self.save_resume_data_timer.start(190)
+        self.prev_status_cleanup_timer = LoopingCall(self.cleanup_prev_status)
+        self.prev_status_cleanup_timer.start(10)
 
         if self.last_seen_complete_loop:
             self.last_seen_complete_loop.start(60)
 
+        # Have libtorrent push the status of changed torrents every second,
+        # instead of asking every torrent handle for it (libtorrent >= 0.16)
+        self.post_torrent_updates_timer = None
+        if hasattr(self.session, "post_torrent_updates"):
+            self.post_torrent_updates_timer = LoopingCall(
+                self.session.post_torrent_updates)
+            self.post_torrent_updates_timer.start(1)
+
     def stop(self):
         # Stop timers
         if self.save_state_timer.running:
             self.save_state_timer.stop()
 
+        if self.post_torrent_updates_timer and \
+                self.post_torrent_updates_timer.running:
+            self.post_torrent_updates_timer.stop()
+
         if self.save_resume_data_timer.running:
             self.save_resume_data_timer.stop()
 
+        if self.prev_status_cleanup_timer.running:
+            self.prev_status_cleanup_timer.stop()
+
         if self.last_seen_complete_loop:
             self.last_seen_complete_loop.stop()
 
         # Save state on shutdown
+        if self.save_state_call and self.save_state_call.active():
+            self.save_state_call.cancel()
         self.save_state()
 
+        if self.save_resume_data_call and self.save_resume_data_call.active():
+            self.save_resume_data_call.cancel()
+
         # Make another list just to make sure all paused torrents will be
         # passed to self.save_resume_data(). With
         # self.shutdown_torrent_pause_list it is possible to have a case when
         # torrent_id is removed from it in self.on_alert_torrent_paused()
         # before we call self.save_resume_data() here.
-        save_resume_data_list = []
+        save_resume_data_list = [torrent_id for torrent_id in
+                                 self.pending_resume_data
+                                 if torrent_id in self.torrents]
+        self.pending_resume_data.clear()
         for key in self.torrents:
-            # Stop the status cleanup LoopingCall here
-            self.torrents[key].prev_status_cleanup_loop.stop()
             if not self.torrents[key].handle.is_paused():
                 # We set auto_managed false to prevent lt from resuming the torrent
                 self.torrents[key].handle.auto_managed(False)
                 self.torrents[key].handle.pause()
                 self.shutdown_torrent_pause_list.append(key)
-                save_resume_data_list.append(key)
+                if key not in save_resume_data_list:
+                    save_resume_data_list.append(key)
 
         self.save_resume_data(save_resume_data_list)
 
-        # We have to wait for all torrents to pause and write their resume data
-        wait = True
-        while wait:
+        # We have to wait for all torrents to pause and write their resume data.
+        def waiting():
             if self.shutdown_torrent_pause_list:
-                wait = True
-            else:
-                wait = False
-                for torrent in self.torrents.values():
-                    if torrent.waiting_on_resume_data:
-                        wait = True
-                        break
-
-            time.sleep(0.01)
-            # Wait for all alerts
+                return True
+            for torrent in self.torrents.itervalues():
+                if torrent.waiting_on_resume_data:
+                    return True
+            return False
+
+        def timed_out():
+            if time.time() - wait_start > 60:
+                log.warning("Timed out waiting for torrents to pause and save "
+                            "their resume data.")
+                return True
+            return False
+
+        wait_start = time.time()
+
+        if not reactor.running:
+            # Classic mode stops the components after the reactor has
+            # returned, so no LoopingCall would ever fire; block instead.
             self.alerts.handle_alerts(True)
+            while waiting() and not timed_out():
+                time.sleep(0.01)
+                self.alerts.handle_alerts(True)
+            return
+
+        # Poll for the alerts from the reactor rather than blocking it.
+        def on_wait():
+            self.alerts.handle_alerts(True)
+            if not waiting() or timed_out():
+                wait_loop.stop()
+
+        wait_loop = LoopingCall(on_wait)
+        return wait_loop.start(0.01)
 
     def update(self):
-        for torrent_id, torrent in self.torrents.items():
-            if torrent.options["stop_at_ratio"] and torrent.state not in (
-                                "Checking", "Allocating", "Paused", "Queued"):
-                # If the global setting is set, but the per-torrent isn't..
-                # Just skip to the next torrent.
-                # This is so that a user can turn-off the stop at ratio option
-                # on a per-torrent basis
-                if not torrent.options["stop_at_ratio"]:
-                    continue
-                if torrent.get_ratio() >= torrent.options["stop_ratio"] and torrent.is_finished:
-                    if torrent.options["remove_at_ratio"]:
-                        self.remove(torrent_id)
-                        break
-                    if not torrent.handle.is_paused():
-                        torrent.pause()
+        for torrent_id, torrent in self.torrents.iteritems():
+            options = torrent.options
+            # The stop at ratio option can be turned off on a per-torrent basis
+            if not options["stop_at_ratio"]:
+                continue
+            if torrent.state in STOP_AT_RATIO_SKIP_STATES:
+                continue
+            if not torrent.is_finished:
+                continue
+            if torrent.get_ratio() >= options["stop_ratio"]:
+                if options["remove_at_ratio"]:
+                    # The dict is changed by the removal, so stop iterating
+                    self.remove(torrent_id)
+                    break
+                if not torrent.handle.is_paused():
+                    torrent.pause()
+
+    def cleanup_prev_status(self):
+        """
+        Removes the previous status dicts of sessions that are no longer valid,
+        and piece states that can no longer be reused, from all the torrents.
+        """
+        for torrent in self.torrents.itervalues():
+            if torrent.prev_status or torrent.pieces_info_cache is not None:
+                torrent.cleanup_prev_status()
 
     def __getitem__(self, torrent_id):
         """Return the Torrent with torrent_id"""
@@ -297,15 +416,12 @@ class TorrentManager(component.Component):
     def get_torrent_list(self):
         """Returns a list of torrent_ids"""
         torrent_ids = self.torrents.keys()
-        if component.get("RPCServer").get_session_auth_level() == AUTH_LEVEL_ADMIN:
+        if self.rpcserver.get_session_auth_level() == AUTH_LEVEL_ADMIN:
             return torrent_ids
 
-        current_user = component.get("RPCServer").get_session_user()
-        for torrent_id in torrent_ids[:]:
-            torrent_status = self[torrent_id].get_status(["owner", "shared"])
-            if torrent_status["owner"] != current_user and torrent_status["shared"] == False:
-                torrent_ids.pop(torrent_ids.index(torrent_id))
-        return torrent_ids
+        current_user = self.rpcserver.get_session_user()
+        return [torrent_id for torrent_id, torrent in self.torrents.iteritems()
+                if torrent.owner == current_user or torrent.options["shared"]]
 
     def get_torrent_info_from_file(self, filepath):
         """Returns a torrent_info for the file specified or None"""
@@ -313,10 +429,8 @@ class TorrentManager(component.Component):
         # Get the torrent data from the torrent file
         try:
             log.debug("Attempting to create torrent_info from %s", filepath)
-            _file = open(filepath, "rb")
-            torrent_info = lt.torrent_info(lt.bdecode(_file.read()))
-            _file.close()
-        except (IOError, RuntimeError), e:
+            torrent_info = lt.torrent_info(lt.bdecode(read_file(filepath)))
+        except (IOError, OSError, RuntimeError), e:
             log.warning("Unable to open %s: %s", filepath, e)
 
         return torrent_info
@@ -325,19 +439,16 @@ class TorrentManager(component.Component):
         """Returns an entry with the resume data or None"""
         fastresume = ""
         try:
-            _file = open(os.path.join(get_config_dir(), "state",
-                                      torrent_id + ".fastresume"), "rb")
-            fastresume = _file.read()
-            _file.close()
-        except IOError, e:
+            fastresume = read_file(
+                os.path.join(self.state_dir, torrent_id + ".fastresume"))
+        except (IOError, OSError), e:
             log.debug("Unable to load .fastresume: %s", e)
 
         return str(fastresume)
 
     def legacy_delete_resume_data(self, torrent_id):
         """Deletes the .fastresume file"""
-        path = os.path.join(get_config_dir(), "state",
-                            torrent_id + ".fastresume")
+        path = os.path.join(self.state_dir, torrent_id + ".fastresume")
         log.debug("Deleting fastresume file: %s", path)
         try:
             os.remove(path)
@@ -349,7 +460,7 @@ class TorrentManager(component.Component):
         """Add a torrent to the manager and returns it's torrent_id"""
 
         if owner is None:
-            owner = component.get("RPCServer").get_session_user()
+            owner = self.rpcserver.get_session_user()
             if not owner:
                 owner = "localclient"
 
@@ -393,8 +504,7 @@ class TorrentManager(component.Component):
             options["shared"] = state.shared
 
             ti = self.get_torrent_info_from_file(
-                    os.path.join(get_config_dir(),
-                                    "state", state.torrent_id + ".torrent"))
+                    os.path.join(self.state_dir, state.torrent_id + ".torrent"))
             if ti:
                 add_torrent_params["ti"] = ti
             elif state.magnet:
@@ -417,26 +527,16 @@ class TorrentManager(component.Component):
                 if add_torrent_id in self.get_torrent_list():
                     # Torrent already exists just append any extra trackers.
                     log.debug("Torrent (%s) exists, checking for trackers to add...", add_torrent_id)
-                    add_torrent_trackers = []
-                    for value in torrent_info.trackers():
-                        tracker = {}
-                        tracker["url"] = value.url
-                        tracker["tier"] = value.tier
-                        add_torrent_trackers.append(tracker)
-
-                    torrent_trackers = {}
-                    tracker_list = []
-                    for tracker in  self[add_torrent_id].get_status(["trackers"])["trackers"]:
-                        torrent_trackers[(tracker["url"])] = tracker
-                        tracker_list.append(tracker)
-
-                    added_tracker = False
-                    for tracker in add_torrent_trackers:
-                        if tracker['url'] not in torrent_trackers:
-                            tracker_list.append(tracker)
-                            added_tracker = True
-
-                    if added_tracker:
+                    tracker_list = list(self[add_torrent_id].trackers)
+                    tracker_urls = set(tracker["url"] for tracker in tracker_list)
+                    add_torrent_trackers = [
+                        {"url": value.url, "tier": value.tier}
+                        for value in torrent_info.trackers()
+                        if value.url not in tracker_urls
+                    ]
+
+                    if add_torrent_trackers:
+                        tracker_list.extend(add_torrent_trackers)
                         self[add_torrent_id].set_trackers(tracker_list)
                     return
 
@@ -498,9 +598,9 @@ class TorrentManager(component.Component):
         handle.auto_managed(False)
         # Create a Torrent object
         owner = state.owner if state else (
-            owner if owner else component.get("RPCServer").get_session_user()
+            owner if owner else self.rpcserver.get_session_user()
         )
-        account_exists = component.get("AuthManager").has_account(owner)
+        account_exists = self.authmanager.has_account(owner)
         if not account_exists:
             owner = 'localclient'
         torrent = Torrent(handle, options, state, filename, magnet, owner)
@@ -521,38 +621,35 @@ class TorrentManager(component.Component):
         # Write the .torrent file to the state directory
         if filedump:
             try:
-                save_file = open(os.path.join(get_config_dir(), "state",
-                        torrent.torrent_id + ".torrent"),
-                        "wb")
-                save_file.write(filedump)
-                save_file.close()
-            except IOError, e:
+                write_file(os.path.join(self.state_dir,
+                                        torrent.torrent_id + ".torrent"),
+                           filedump)
+            except OSError, e:
                 log.warning("Unable to save torrent file: %s", e)
 
             # If the user has requested a copy of the torrent be saved elsewhere
-            # we need to do that.
+            # we need to do that.  It is written separately so that it stays
+            # independent of the copy in the state directory.
             if self.config["copy_torrent_file"] and filename is not None:
                 try:
-                    save_file = open(
-                        os.path.join(self.config["torrentfiles_location"], filename),
-                        "wb")
-                    save_file.write(filedump)
-                    save_file.close()
-                except IOError, e:
+                    write_file(os.path.join(
+                        self.config["torrentfiles_location"], filename),
+                        filedump)
+                except OSError, e:
                     log.warning("Unable to save torrent file: %s", e)
 
         if save_state:
             # Save the session state
-            self.save_state()
+            self.save_state_soon()
 
         # Emit torrent_added signal
         from_state = state is not None
-        component.get("EventManager").emit(
+        self.eventmanager.emit(
             TorrentAddedEvent(torrent.torrent_id, from_state)
         )
         log.info("Torrent %s from user \"%s\" %s",
-                 torrent.get_status(["name"])["name"],
-                 torrent.get_status(["owner"])["owner"],
+                 torrent.get_name(),
+                 torrent.owner,
                  (from_state and "loaded" or "added"))
         return torrent.torrent_id
 
@@ -562,19 +659,16 @@ class TorrentManager(component.Component):
         # Get the torrent data from the torrent file
         try:
             log.debug("Attempting to open %s for add.", torrent_id)
-            _file = open(
-                os.path.join(
-                    get_config_dir(), "state", torrent_id + ".torrent"),
-                        "rb")
-            filedump = lt.bdecode(_file.read())
-            _file.close()
-        except (IOError, RuntimeError), e:
+            filedump = lt.bdecode(read_file(
+                os.path.join(self.state_dir, torrent_id + ".torrent")))
+        except (IOError, OSError, RuntimeError), e:
             log.warning("Unable to open %s: %s", torrent_id, e)
             return False
 
         return filedump
 
-    def remove(self, torrent_id, remove_data=False):
+    def remove(self, torrent_id, remove_data=False, save_state=True,
+               resume_data=None):
         """
         Remove a torrent from the session.
 
@@ -582,6 +676,12 @@ class TorrentManager(component.Component):
         :type torrent_id: string
         :param remove_data: if True, remove the downloaded data
         :type remove_data: bool
+        :param save_state: if True, save the session state after removing
+        :type save_state: bool
+        :param resume_data: the loaded resume data to drop the torrent from, the
+            caller is then responsible for saving it; if None the resume data
+            file is loaded and saved here
+        :type resume_data: dict
 
         :returns: True if removed successfully, False if not
         :rtype: bool
@@ -593,10 +693,10 @@ class TorrentManager(component.Component):
         if torrent_id not in self.torrents:
             raise InvalidTorrentError("torrent_id not in session")
 
-        torrent_name = self.torrents[torrent_id].get_status(["name"])["name"]
+        torrent_name = self.torrents[torrent_id].get_name()
 
         # Emit the signal to the clients
-        component.get("EventManager").emit(PreTorrentRemovedEvent(torrent_id))
+        self.eventmanager.emit(PreTorrentRemovedEvent(torrent_id))
 
         try:
             self.session.remove_torrent(self.torrents[torrent_id].handle,
@@ -606,9 +706,13 @@ class TorrentManager(component.Component):
             return False
 
         # Remove fastresume data if it is exists
-        resume_data = self.load_resume_data_file()
-        resume_data.pop(torrent_id, None)
-        self.save_resume_data_file(resume_data)
+        self.resume_data.pop(torrent_id, None)
+        if resume_data is None:
+            resume_data = self.load_resume_data_file()
+            resume_data.pop(torrent_id, None)
+            self.save_resume_data_file(resume_data)
+        else:
+            resume_data.pop(torrent_id, None)
 
         # Remove the .torrent file in the state
         self.torrents[torrent_id].delete_torrentfile()
@@ -628,9 +732,6 @@ class TorrentManager(component.Component):
             except Exception, e:
                 log.warning("Unable to remove copy torrent file: %s", e)
 
-        # Stop the looping call
-        self.torrents[torrent_id].prev_status_cleanup_loop.stop()
-
         # Remove from set if it wasn't finished
         if not self.torrents[torrent_id].is_finished:
             try:
@@ -645,12 +746,13 @@ class TorrentManager(component.Component):
             return False
 
         # Save the session state
-        self.save_state()
+        if save_state:
+            self.save_state_soon()
 
         # Emit the signal to the clients
-        component.get("EventManager").emit(TorrentRemovedEvent(torrent_id))
+        self.eventmanager.emit(TorrentRemovedEvent(torrent_id))
         log.info("Torrent %s removed by user: %s", torrent_name,
-                 component.get("RPCServer").get_session_user())
+                 self.rpcserver.get_session_user())
         return True
 
     def load_state(self):
@@ -659,20 +761,21 @@ class TorrentManager(component.Component):
 
         try:
             log.debug("Opening torrent state file for load.")
-            state_file = open(
-                os.path.join(get_config_dir(), "state", "torrents.state"), "rb")
+            state_file = open(self.state_path, "rb")
             state = cPickle.load(state_file)
             state_file.close()
         except (EOFError, IOError, Exception, cPickle.UnpicklingError), e:
             log.warning("Unable to load state file: %s", e)
 
-        # Try to use an old state
+        # Try to use an old state by giving its torrents the default value of
+        # any attribute they are missing
         try:
-            state_tmp = TorrentState()
-            if dir(state.torrents[0]) != dir(state_tmp):
-                for attr in (set(dir(state_tmp)) - set(dir(state.torrents[0]))):
-                    for s in state.torrents:
-                        setattr(s, attr, getattr(state_tmp, attr, None))
+            defaults = TorrentState().__dict__
+            missing = set(defaults) - set(state.torrents[0].__dict__)
+            if missing:
+                defaults = dict((attr, defaults[attr]) for attr in missing)
+                for s in state.torrents:
+                    s.__dict__.update(defaults)
         except Exception, e:
             log.warning("Unable to update state file to a compatible version: %s", e)
 
@@ -695,30 +798,29 @@ class TorrentManager(component.Component):
             log.debug("libtorrent version is lower than 0.16. Start looping "
                       "callback to calculate last_seen_complete info.")
             def calculate_last_seen_complete():
-                for torrent in self.torrents.values():
-                    torrent.calculate_last_seen_complete()
+                for torrent in self.torrents.itervalues():
+                    # A complete copy can only be seen on connected peers, so
+                    # don't fetch the piece availability of peerless torrents
+                    if torrent.get_lt_status().num_peers:
+                        torrent.calculate_last_seen_complete()
             self.last_seen_complete_loop = LoopingCall(
                 calculate_last_seen_complete
             )
 
-        component.get("EventManager").emit(SessionStartedEvent())
+        self.eventmanager.emit(SessionStartedEvent())
 
     def save_state(self):
         """Save the state of the TorrentManager to the torrents.state file"""
         state = TorrentManagerState()
         # Create the state for each Torrent and append to the list
-        for torrent in self.torrents.values():
-            paused = False
-            if torrent.state == "Paused":
-                paused = True
-
+        for torrent in self.torrents.itervalues():
             torrent_state = TorrentState(
                 torrent.torrent_id,
                 torrent.filename,
-                torrent.get_status(["total_uploaded"])["total_uploaded"],
+                torrent.get_lt_status().all_time_upload,
                 torrent.trackers,
                 torrent.options["compact_allocation"],
-                paused,
+                torrent.state == "Paused",
                 torrent.options["download_location"],
                 torrent.options["max_connections"],
                 torrent.options["max_upload_slots"],
@@ -746,28 +848,47 @@ class TorrentManager(component.Component):
         # Pickle the TorrentManagerState object
         try:
             log.debug("Saving torrent state file.")
-            state_file = open(os.path.join(get_config_dir(),
-                              "state", "torrents.state.new"), "wb")
-            cPickle.dump(state, state_file)
+            # Pickle to a string first so the file gets a single write
+            state_data = cPickle.dumps(state, cPickle.HIGHEST_PROTOCOL)
+            state_digest = sha1(state_data).digest()
+            # Nothing changed since the last save, so the file on disk is
+            # current
+            if state_digest == self.state_digest:
+                return True
+            state_file = open(self.state_new_path, "wb")
+            state_file.write(state_data)
+            # Make sure the new state is on disk before it replaces the old one
             state_file.flush()
-            os.fsync(state_file.fileno())
+            fdatasync(state_file.fileno())
             state_file.close()
         except IOError, e:
             log.warning("Unable to save state file: %s", e)
             return True
 
-        # We have to move the 'torrents.state.new' file to 'torrents.state'
+        # We have to move the 'torrents.state.new' file to 'torrents.state'.
+        # Windows can't rename over an existing file, so leave it to shutil.
         try:
-            shutil.move(
-                os.path.join(get_config_dir(), "state", "torrents.state.new"),
-                os.path.join(get_config_dir(), "state", "torrents.state"))
-        except IOError:
+            if windows_check():
+                shutil.move(self.state_new_path, self.state_path)
+            else:
+                os.rename(self.state_new_path, self.state_path)
+        except (IOError, OSError):
             log.warning("Unable to save state file.")
             return True
 
+        self.state_digest = state_digest
+
         # We return True so that the timer thread will continue
         return True
 
+    def save_state_soon(self):
+        """
+        Saves the state of the TorrentManager in a couple of seconds, so that
+        adding or removing many torrents in a row only saves it once.
+        """
+        if self.save_state_call is None or not self.save_state_call.active():
+            self.save_state_call = reactor.callLater(2, self.save_state)
+
     def save_resume_data(self, torrent_ids=None):
         """
         Saves resume data for list of torrent_ids or for all torrents if
@@ -775,21 +896,43 @@ class TorrentManager(component.Component):
         """
 
         if torrent_ids is None:
-            torrent_ids = self.torrents.keys()
+            torrents = self.torrents.values()
+        else:
+            torrents = [self.torrents[torrent_id] for torrent_id in torrent_ids]
 
-        for torrent_id in torrent_ids:
-            self.torrents[torrent_id].save_resume_data()
+        for torrent in torrents:
+            torrent.save_resume_data()
+
+        self.num_resume_data = len(torrents)
+
+    def save_resume_data_soon(self, torrent_id):
+        """
+        Saves the resume data of a torrent in a second, together with that of
+        any other torrent that needs saving by then.
+
+        :param torrent_id: the torrent to save the resume data of
+        :type torrent_id: string
 
-        self.num_resume_data = len(torrent_ids)
+        """
+        self.pending_resume_data.add(torrent_id)
+        if self.save_resume_data_call is None or \
+                not self.save_resume_data_call.active():
+            self.save_resume_data_call = reactor.callLater(
+                1, self.save_pending_resume_data)
+
+    def save_pending_resume_data(self):
+        """Saves the resume data of the torrents passed to save_resume_data_soon"""
+        torrent_ids = [torrent_id for torrent_id in self.pending_resume_data
+                       if torrent_id in self.torrents]
+        self.pending_resume_data.clear()
+        if torrent_ids:
+            self.save_resume_data(torrent_ids)
 
     def load_resume_data_file(self):
         resume_data = {}
         try:
             log.debug("Opening torrents fastresume file for load.")
-            fastresume_file = open(os.path.join(get_config_dir(), "state",
-                                                "torrents.fastresume"), "rb")
-            resume_data = lt.bdecode(fastresume_file.read())
-            fastresume_file.close()
+            resume_data = lt.bdecode(read_file(self.fastresume_path))
         except (EOFError, IOError, Exception), e:
             log.warning("Unable to load fastresume file: %s", e)
 
@@ -811,11 +954,13 @@ class TorrentManager(component.Component):
         :type resume_data: dict
 
         """
-        # Check to see if we're waiting on more resume data
-        if self.num_resume_data or not self.resume_data:
+        # Check to see if we're waiting on more resume data, or have nothing
+        # new to save.  An explicit `resume_data` is always saved, as it holds
+        # changes, such as removed torrents, the pending data won't bring.
+        if resume_data is None and (self.num_resume_data or not self.resume_data):
             return
 
-        path = os.path.join(get_config_dir(), "state", "torrents.fastresume")
+        path = self.fastresume_new_path
 
         # First step is to load the existing file and update the dictionary
         if resume_data is None:
@@ -824,15 +969,35 @@ class TorrentManager(component.Component):
         resume_data.update(self.resume_data)
         self.resume_data = {}
 
+        # Write to 'torrents.fastresume.new' so a failed or interrupted save
+        # leaves the existing file untouched
         try:
             log.debug("Saving fastresume file: %s", path)
-            fastresume_file = open(path, "wb")
-            fastresume_file.write(lt.bencode(resume_data))
-            fastresume_file.flush()
-            os.fsync(fastresume_file.fileno())
-            fastresume_file.close()
-        except IOError:
-            log.warning("Error trying to save fastresume file")
+            # Bencode the dict one entry at a time, in the sorted key order
+            # bencoding requires, so the whole file is never built in memory
+            fastresume_file = open(path, "wb", 65536)
+            try:
+                fastresume_file.write("d")
+                for torrent_id in sorted(resume_data):
+                    fastresume_file.write(lt.bencode(torrent_id))
+                    fastresume_file.write(lt.bencode(resume_data[torrent_id]))
+                fastresume_file.write("e")
+                fastresume_file.flush()
+                fdatasync(fastresume_file.fileno())
+            finally:
+                fastresume_file.close()
+        except Exception, e:
+            log.warning("Error trying to save fastresume file: %s", e)
+            return
+
+        # Then move it over 'torrents.fastresume', like save_state() does
+        try:
+            if windows_check():
+                shutil.move(path, self.fastresume_path)
+            else:
+                os.rename(path, self.fastresume_path)
+        except (IOError, OSError), e:
+            log.warning("Error trying to save fastresume file: %s", e)
 
     def remove_empty_folders(self, torrent_id, folder):
         """
@@ -843,9 +1008,9 @@ class TorrentManager(component.Component):
         if torrent_id not in self.torrents:
             raise InvalidTorrentError("torrent_id is not in session")
 
-        info = self.torrents[torrent_id].get_status(['save_path'])
-        # Regex removes leading slashes that causes join function to ignore save_path
-        folder_full_path = os.path.join(info['save_path'], re.sub("^/*", "", folder))
+        save_path = self.torrents[torrent_id].options["download_location"]
+        # Remove leading slashes that cause the join function to ignore save_path
+        folder_full_path = os.path.join(save_path, folder.lstrip("/"))
         folder_full_path = os.path.normpath(folder_full_path)
 
         try:
@@ -858,14 +1023,13 @@ class TorrentManager(component.Component):
                         try:
                             os.removedirs(os.path.join(root, name))
                             log.debug("Removed Empty Folder %s", os.path.join(root, name))
-                        except OSError as (errno, strerror):
-                            from errno import ENOTEMPTY
-                            if errno == ENOTEMPTY:
+                        except OSError, e:
+                            if e.errno == ENOTEMPTY:
                                 # Error raised if folder is not empty
-                                log.debug("%s", strerror)
+                                log.debug("%s", e.strerror)
 
-        except OSError as (errno, strerror):
-            log.debug("Cannot Remove Folder: %s (ErrNo %s)", strerror, errno)
+        except OSError, e:
+            log.debug("Cannot Remove Folder: %s (ErrNo %s)", e.strerror, e.errno)
 
     def get_queue_position(self, torrent_id):
         """Get queue position of torrent"""
@@ -906,38 +1070,46 @@ class TorrentManager(component.Component):
     def on_set_max_connections_per_torrent(self, key, value):
         """Sets the per-torrent connection limit"""
         log.debug("max_connections_per_torrent set to %s..", value)
-        for key in self.torrents.keys():
-            self.torrents[key].set_max_connections(value)
+        # Only cross into libtorrent for torrents whose limit changes
+        for torrent in self.torrents.itervalues():
+            if torrent.options["max_connections"] != value:
+                torrent.set_max_connections(value)
 
     def on_set_max_upload_slots_per_torrent(self, key, value):
         """Sets the per-torrent upload slot limit"""
         log.debug("max_upload_slots_per_torrent set to %s..", value)
-        for key in self.torrents.keys():
-            self.torrents[key].set_max_upload_slots(value)
+        # Only cross into libtorrent for torrents whose limit changes
+        for torrent in self.torrents.itervalues():
+            if torrent.options["max_upload_slots"] != value:
+                torrent.set_max_upload_slots(value)
 
     def on_set_max_upload_speed_per_torrent(self, key, value):
         log.debug("max_upload_speed_per_torrent set to %s..", value)
-        for key in self.torrents.keys():
-            self.torrents[key].set_max_upload_speed(value)
+        # Only cross into libtorrent for torrents whose limit changes
+        for torrent in self.torrents.itervalues():
+            if torrent.options["max_upload_speed"] != value:
+                torrent.set_max_upload_speed(value)
 
     def on_set_max_download_speed_per_torrent(self, key, value):
         log.debug("max_download_speed_per_torrent set to %s..", value)
-        for key in self.torrents.keys():
-            self.torrents[key].set_max_download_speed(value)
+        # Only cross into libtorrent for torrents whose limit changes
+        for torrent in self.torrents.itervalues():
+            if torrent.options["max_download_speed"] != value:
+                torrent.set_max_download_speed(value)
 
     ## Alert handlers ##
     def on_alert_torrent_finished(self, alert):
         log.debug("on_alert_torrent_finished")
         try:
-            torrent = self.torrents[str(alert.handle.info_hash())]
             torrent_id = str(alert.handle.info_hash())
+            torrent = self.torrents[torrent_id]
         except:
             return
         log.debug("%s is finished..", torrent_id)
 
         # Get the total_download and if it's 0, do not move.. It's likely
         # that the torrent wasn't downloaded, but just added.
-        total_download = torrent.get_status(["total_payload_download"])["total_payload_download"]
+        total_download = torrent.get_lt_status().total_payload_download
 
         # Move completed download to completed folder if needed
         if not torrent.is_finished and total_download:
@@ -948,7 +1120,7 @@ class TorrentManager(component.Component):
                 if torrent.options["download_location"] != move_path:
                     torrent.move_storage(move_path)
 
-            component.get("EventManager").emit(TorrentFinishedEvent(torrent_id))
+            self.eventmanager.emit(TorrentFinishedEvent(torrent_id))
 
         torrent.is_finished = True
         torrent.update_state()
@@ -966,26 +1138,26 @@ class TorrentManager(component.Component):
         # worth really to save in resume data, we just read it up in
         # self.load_state().
         if total_download:
-            self.save_resume_data((torrent_id, ))
+            self.save_resume_data_soon(torrent_id)
 
     def on_alert_torrent_paused(self, alert):
         log.debug("on_alert_torrent_paused")
         try:
-            torrent = self.torrents[str(alert.handle.info_hash())]
             torrent_id = str(alert.handle.info_hash())
+            torrent = self.torrents[torrent_id]
         except:
             return
         # Set the torrent state
         old_state = torrent.state
         torrent.update_state()
         if torrent.state != old_state:
-            component.get("EventManager").emit(TorrentStateChangedEvent(torrent_id, torrent.state))
+            self.eventmanager.emit(TorrentStateChangedEvent(torrent_id, torrent.state))
 
         # Don't save resume data for each torrent after self.stop() was called.
         # We save resume data in bulk in self.stop() in this case.
         if self.save_resume_data_timer.running:
             # Write the fastresume file
-            self.save_resume_data((torrent_id, ))
+            self.save_resume_data_soon(torrent_id)
 
         if torrent_id in self.shutdown_torrent_pause_list:
             self.shutdown_torrent_pause_list.remove(torrent_id)
@@ -1019,8 +1191,8 @@ class TorrentManager(component.Component):
             torrent.set_tracker_status(_("Announce OK"))
 
         # Check to see if we got any peer information from the tracker
-        if alert.handle.status().num_complete == -1 or \
-            alert.handle.status().num_incomplete == -1:
+        status = alert.handle.status()
+        if status.num_complete == -1 or status.num_incomplete == -1:
             # We didn't get peer information, so lets send a scrape request
             torrent.scrape_tracker()
 
@@ -1065,16 +1237,16 @@ class TorrentManager(component.Component):
     def on_alert_torrent_resumed(self, alert):
         log.debug("on_alert_torrent_resumed")
         try:
-            torrent = self.torrents[str(alert.handle.info_hash())]
             torrent_id = str(alert.handle.info_hash())
+            torrent = self.torrents[torrent_id]
         except:
             return
         old_state = torrent.state
         torrent.update_state()
         if torrent.state != old_state:
             # We need to emit a TorrentStateChangedEvent too
-            component.get("EventManager").emit(TorrentStateChangedEvent(torrent_id, torrent.state))
-        component.get("EventManager").emit(TorrentResumedEvent(torrent_id))
+            self.eventmanager.emit(TorrentStateChangedEvent(torrent_id, torrent.state))
+        self.eventmanager.emit(TorrentResumedEvent(torrent_id))
 
     def on_alert_state_changed(self, alert):
         log.debug("on_alert_state_changed")
@@ -1088,13 +1260,13 @@ class TorrentManager(component.Component):
         torrent.update_state()
 
         # Torrent may need to download data after checking.
-        if torrent.state in ('Checking', 'Checking Resume Data', 'Downloading'):
+        if torrent.state in UNFINISHED_STATES:
             torrent.is_finished = False
             self.queued_torrents.add(torrent_id)
 
         # Only emit a state changed event if the state has actually changed
         if torrent.state != old_state:
-            component.get("EventManager").emit(TorrentStateChangedEvent(torrent_id, torrent.state))
+            self.eventmanager.emit(TorrentStateChangedEvent(torrent_id, torrent.state))
 
     def on_alert_save_resume_data(self, alert):
         log.debug("on_alert_save_resume_data")
@@ -1129,32 +1301,33 @@ class TorrentManager(component.Component):
         log.debug("on_alert_file_renamed")
         log.debug("index: %s name: %s", alert.index, alert.name.decode("utf8"))
         try:
-            torrent = self.torrents[str(alert.handle.info_hash())]
             torrent_id = str(alert.handle.info_hash())
+            torrent = self.torrents[torrent_id]
         except:
             return
 
-        # We need to see if this file index is in a waiting_on_folder list
-        folder_rename = False
-        for i, wait_on_folder in enumerate(torrent.waiting_on_folder_rename):
-            if alert.index in wait_on_folder[2]:
-                folder_rename = True
-                if len(wait_on_folder[2]) == 1:
-                    # This is the last alert we were waiting for, time to send signal
-                    component.get("EventManager").emit(TorrentFolderRenamedEvent(torrent_id, wait_on_folder[0], wait_on_folder[1]))
-                    # Empty folders are removed after libtorrent folder renames
-                    self.remove_empty_folders(torrent_id, wait_on_folder[0])
-                    del torrent.waiting_on_folder_rename[i]
-                    self.save_resume_data((torrent_id,))
-                    break
-                # This isn't the last file to be renamed in this folder, so just
-                # remove the index and continue
-                torrent.waiting_on_folder_rename[i][2].remove(alert.index)
-
-        if not folder_rename:
+        # The file paths have changed
+        torrent.files_cache = None
+        torrent.files_cache_info = None
+
+        # We need to see if this file index is part of a folder rename
+        waiting = torrent.waiting_on_folder_rename.get(alert.index)
+        if waiting:
+            # Renames of the same file complete in the order they were made
+            wait_on_folder = waiting.pop(0)
+            if not waiting:
+                del torrent.waiting_on_folder_rename[alert.index]
+            wait_on_folder[2].discard(alert.index)
+            if not wait_on_folder[2]:
+                # This is the last alert we were waiting for, time to send signal
+                self.eventmanager.emit(TorrentFolderRenamedEvent(torrent_id, wait_on_folder[0], wait_on_folder[1]))
+                # Empty folders are removed after libtorrent folder renames
+                self.remove_empty_folders(torrent_id, wait_on_folder[0])
+                self.save_resume_data_soon(torrent_id)
+        else:
             # This is just a regular file rename so send the signal
-            component.get("EventManager").emit(TorrentFileRenamedEvent(torrent_id, alert.index, alert.name))
-            self.save_resume_data((torrent_id,))
+            self.eventmanager.emit(TorrentFileRenamedEvent(torrent_id, alert.index, alert.name))
+            self.save_resume_data_soon(torrent_id)
 
     def on_alert_metadata_received(self, alert):
         log.debug("on_alert_metadata_received")
@@ -1178,5 +1351,15 @@ class TorrentManager(component.Component):
             torrent_id = str(alert.handle.info_hash())
         except:
             return
-        component.get("EventManager").emit(
+        self.eventmanager.emit(
             TorrentFileCompletedEvent(torrent_id, alert.index))
+
+    def on_alert_state_update(self, alert):
+        for status in alert.status:
+            torrent_id = str(status.handle.info_hash())
+            if torrent_id in self.torrents:
+                self.torrents[torrent_id].update_status(status)
+
+        # The torrents missing from the alert had no state changes since the
+        # last update, their time based fields are refreshed by get_lt_status
+        self.last_state_update = time.time()
@@ -12,6 +12,7 @@ except ImportError:
     from sha import sha
 
 import os
+import base64
 import common
 import warnings
 rpath = common.rpath
@@ -83,10 +84,15 @@ class CoreTestCase(unittest.TestCase):
 
         return component.shutdown().addCallback(on_shutdown)
 
+    def add_test_torrent(self):
+        """Adds test.torrent to the session and returns its torrent_id"""
+        filename = os.path.join(os.path.dirname(__file__), "test.torrent")
+        return self.core.add_torrent_file(
+            filename, base64.encodestring(open(filename, "rb").read()), {})
+
     def test_add_torrent_file(self):
         options = {}
         filename = os.path.join(os.path.dirname(__file__), "test.torrent")
-        import base64
         torrent_id = self.core.add_torrent_file(filename, base64.encodestring(open(filename).read()), options)
 
         # Get the info hash from the test.torrent
@@ -148,10 +154,7 @@ class CoreTestCase(unittest.TestCase):
         self.assertEquals(torrent_id, info_hash)
 
     def test_remove_torrent(self):
-        options = {}
-        filename = os.path.join(os.path.dirname(__file__), "test.torrent")
-        import base64
-        torrent_id = self.core.add_torrent_file(filename, base64.encodestring(open(filename).read()), options)
+        torrent_id = self.add_test_torrent()
 
         self.assertRaises(deluge.error.InvalidTorrentError, self.core.remove_torrent, "torrentidthatdoesntexist", True)
 
@@ -160,6 +163,31 @@ class CoreTestCase(unittest.TestCase):
         self.assertTrue(ret)
         self.assertEquals(len(self.core.get_session_state()), 0)
 
+    def test_remove_torrents(self):
+        torrent_id = self.add_test_torrent()
+
+        errors = self.core.remove_torrents([torrent_id, "torrentidthatdoesntexist"], True)
+
+        self.assertEquals(len(errors), 1)
+        self.assertEquals(errors[0][0], "torrentidthatdoesntexist")
+        self.assertEquals(len(self.core.get_session_state()), 0)
+        self.assertFalse(torrent_id in self.core.torrentmanager.load_resume_data_file())
+
+    def test_get_torrent_status(self):
+        torrent_id = self.add_test_torrent()
+
+        status = self.core.get_torrent_status(torrent_id, ["name", "progress", "save_path"])
+        self.assertEquals(sorted(status.keys()), ["name", "progress", "save_path"])
+        self.assertEquals(status["progress"], 0.0)
+
+        status = self.core.get_torrent_status(torrent_id, [])
+        self.assertEquals(status["hash"], torrent_id)
+        self.assertTrue("total_size" in status)
+        # An empty key list still returns the keys that walk the peers, files
+        # and pieces
+        for key in ("peers", "files", "file_progress", "pieces"):
+            self.assertTrue(key in status)
+
     def test_get_session_status(self):
         status = self.core.get_session_status(["upload_rate", "download_rate"])
         self.assertEquals(type(status), dict)
@@ -201,3 +229,28 @@ class CoreTestCase(unittest.TestCase):
         for key in pathlist:
             self.assertEquals(deluge.core.torrent.sanitize_filepath(key, folder=False), pathlist[key])
             self.assertEquals(deluge.core.torrent.sanitize_filepath(key, folder=True), pathlist[key] + '/')
+
+    def test_get_tracker_host(self):
+        trackers = {
+            'http://tracker.example.com:80/announce': 'example.com',
+            'udp://tracker.example.co.uk:80/announce': 'example.co.uk',
+            'http://a.b.example.org/announce': 'example.org',
+            'http://127.0.0.1:6969/announce': '127.0.0.1',
+            'http://example.com/announce': 'example.com',
+        }
+
+        for key in trackers:
+            self.assertEquals(deluge.core.torrent.get_tracker_host(key), trackers[key])
+
+    def test_read_file(self):
+        from deluge.core.torrentmanager import read_file
+        filename = os.path.join(os.path.dirname(__file__), "test.torrent")
+        self.assertEquals(read_file(filename), open(filename, "rb").read())
+        self.assertRaises(OSError, read_file, "/someinvalidpath")
+
+    def test_write_file(self):
+        from deluge.core.torrentmanager import read_file, write_file
+        filename = self.mktemp()
+        write_file(filename, "some data")
+        write_file(filename, "data")
+        self.assertEquals(read_file(filename), "data")
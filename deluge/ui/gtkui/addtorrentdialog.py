@@ -61,18 +61,12 @@ class AddTorrentDialog(component.Component):
     def __init__(self):
         component.Component.__init__(self, "AddTorrentDialog")
         self.builder = gtk.Builder()
-        # The base dialog
+        # The base dialog, the infohash and url dialogs are only loaded when
+        # first used
         self.builder.add_from_file(deluge.common.resource_filename(
             "deluge.ui.gtkui", os.path.join("glade", "add_torrent_dialog.ui")
         ))
-        # The infohash dialog
-        self.builder.add_from_file(deluge.common.resource_filename(
-            "deluge.ui.gtkui", os.path.join("glade", "add_torrent_dialog.infohash.ui")
-        ))
-        # The url dialog
-        self.builder.add_from_file(deluge.common.resource_filename(
-            "deluge.ui.gtkui", os.path.join("glade", "add_torrent_dialog.url.ui")
-        ))
+        self.loaded_dialogs = set()
 
         self.dialog = self.builder.get_object("dialog_add_torrent")
 
@@ -613,8 +607,21 @@ class AddTorrentDialog(component.Component):
         chooser.destroy()
         self.add_from_files(result)
 
+    def load_dialog(self, name):
+        """
+        Adds the widgets of the 'infohash' or 'url' dialog to the builder the
+        first time they are needed.
+        """
+        if name not in self.loaded_dialogs:
+            self.builder.add_from_file(deluge.common.resource_filename(
+                "deluge.ui.gtkui",
+                os.path.join("glade", "add_torrent_dialog.%s.ui" % name)
+            ))
+            self.loaded_dialogs.add(name)
+
     def _on_button_url_clicked(self, widget):
         log.debug("_on_button_url_clicked")
+        self.load_dialog("url")
         dialog = self.builder.get_object("url_dialog")
         entry = self.builder.get_object("entry_url")
 
@@ -717,6 +724,7 @@ class AddTorrentDialog(component.Component):
 
     def _on_button_hash_clicked(self, widget):
         log.debug("_on_button_hash_clicked")
+        self.load_dialog("infohash")
         dialog = self.builder.get_object("dialog_infohash")
         entry = self.builder.get_object("entry_hash")
         textview = self.builder.get_object("text_trackers")
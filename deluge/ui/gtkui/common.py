@@ -86,6 +86,8 @@ def build_menu_radio_list(value_list, callback, pref_value=None,
                 menuitem = gtk.RadioMenuItem(group, str(value))
 
             group = menuitem
+            # Keep the value so callbacks don't have to parse the label
+            menuitem.set_data("value", value)
 
             if value == pref_value and pref_value != None:
                 menuitem.set_active(True)
@@ -253,7 +255,7 @@ def associate_magnet_links(overwrite=False):
         else:
             key = "/desktop/gnome/url-handlers/magnet/command"
             gconf_client = gconf.client_get_default()
-            if (gconf_client.get(key) and overwrite) or not gconf_client.get(key):
+            if overwrite or not gconf_client.get(key):
                 # We are either going to overwrite the key, or do it if it hasn't been set yet
                 if gconf_client.set_string(key, "deluge '%s'"):
                     gconf_client.set_bool("/desktop/gnome/url-handlers/magnet/needs_terminal", False)
@@ -42,6 +42,8 @@ reactor = gtk2reactor.install()
 
 import gtk
 import sys
+import time
+import traceback
 import logging
 
 log = logging.getLogger(__name__)
@@ -49,8 +51,7 @@ log = logging.getLogger(__name__)
 try:
     from setproctitle import setproctitle, getproctitle
 except ImportError:
-    setproctitle = lambda t: None
-    getproctitle = lambda: None
+    setproctitle = None
 
 import deluge.component as component
 from deluge.ui.client import client
@@ -93,6 +94,9 @@ class Gtk(_UI):
 def start():
     Gtk().start()
 
+# Looked up once as it reads the user's XDG directories file
+DEFAULT_DOWNLOAD_DIR = deluge.common.get_default_download_dir()
+
 DEFAULT_PREFS = {
     "classic_mode": True,
     "interactive_add": True,
@@ -122,12 +126,12 @@ DEFAULT_PREFS = {
     "autoconnect_host_id": None,
     "autostart_localhost": False,
     "autoadd_queued": False,
-    "choose_directory_dialog_path": deluge.common.get_default_download_dir(),
+    "choose_directory_dialog_path": DEFAULT_DOWNLOAD_DIR,
     "show_new_releases": True,
     "signal_port": 40000,
     "ntf_tray_blink": True,
     "ntf_sound": False,
-    "ntf_sound_path": deluge.common.get_default_download_dir(),
+    "ntf_sound_path": DEFAULT_DOWNLOAD_DIR,
     "ntf_popup": False,
     "ntf_email": False,
     "ntf_email_add": "",
@@ -135,7 +139,6 @@ DEFAULT_PREFS = {
     "ntf_pass": "",
     "ntf_server": "",
     "ntf_security": None,
-    "signal_port": 40000,
     "show_sidebar": True,
     "show_toolbar": True,
     "show_statusbar": True,
@@ -153,20 +156,8 @@ DEFAULT_PREFS = {
 
 class GtkUI(object):
     def __init__(self, args):
-        self.daemon_bps = (0,0,0)
+        self.daemon_bps = (time.time(), 0, 0)
         # Setup signals
-        try:
-            import gnome.ui
-            import gnome
-            self.gnome_prog = gnome.init("Deluge", deluge.common.get_version())
-            self.gnome_client = gnome.ui.master_client()
-            def on_die(*args):
-                reactor.stop()
-            self.gnome_client.connect("die", on_die)
-            log.debug("GNOME session 'die' handler registered!")
-        except Exception, e:
-            log.warning("Unable to register a 'die' handler with the GNOME session manager: %s", e)
-
         if deluge.common.windows_check():
             from win32api import SetConsoleCtrlHandler
             from win32con import CTRL_CLOSE_EVENT
@@ -179,11 +170,13 @@ class GtkUI(object):
             SetConsoleCtrlHandler(win_handler)
 
         # Set process name again to fix gtk issue
-        setproctitle(getproctitle())
+        if setproctitle:
+            setproctitle(getproctitle())
 
         # Attempt to register a magnet URI handler with gconf, but do not overwrite
-        # if already set by another program.
-        common.associate_magnet_links(False)
+        # if already set by another program.  This talks to gconfd, so leave it
+        # until the reactor is running rather than holding up the window.
+        reactor.callWhenRunning(common.associate_magnet_links, False)
 
         # Make sure gtkui.conf has at least the defaults set
         self.config = deluge.configmanager.ConfigManager("gtkui.conf", DEFAULT_PREFS)
@@ -197,8 +190,10 @@ class GtkUI(object):
         self.queuedtorrents = QueuedTorrents()
         self.ipcinterface = IPCInterface(args)
 
-        # Initialize gdk threading
-        gtk.gdk.threads_init()
+        # Worker threads (tracker icons, torrent creation, core plugins in
+        # classic mode) need the GIL released around the main loop, but none
+        # of them touch gtk directly so the gdk lock is not needed.
+        gobject.threads_init()
 
 
         # We make sure that the UI components start once we get a core URI
@@ -227,17 +222,16 @@ class GtkUI(object):
         # Show the connection manager
         self.connectionmanager = ConnectionManager()
 
-        from twisted.internet.task import LoopingCall
-        rpc_stats = LoopingCall(self.print_rpc_stats)
-        rpc_stats.start(10)
+        # The rpc stats are only ever logged at debug level
+        if log.isEnabledFor(logging.DEBUG):
+            from twisted.internet.task import LoopingCall
+            rpc_stats = LoopingCall(self.print_rpc_stats)
+            rpc_stats.start(10)
 
         reactor.callWhenRunning(self._on_reactor_start)
 
-        # Initialize gdk threading
-        gtk.gdk.threads_enter()
         reactor.run()
         self.shutdown()
-        gtk.gdk.threads_leave()
 
     def shutdown(self, *args, **kwargs):
         log.debug("gtkui shutting down..")
@@ -256,16 +250,26 @@ class GtkUI(object):
         self.config.save()
 
     def print_rpc_stats(self):
-        import time
+        if not log.isEnabledFor(logging.DEBUG):
+            return
+
         try:
             recv = client.get_bytes_recv()
             sent = client.get_bytes_sent()
         except AttributeError:
             return
 
-        log.debug("sent: %s recv: %s", deluge.common.fsize(sent), deluge.common.fsize(recv))
         t = time.time()
+        if (sent, recv) == self.daemon_bps[1:]:
+            # Nothing moved since the last call, so there is nothing to report
+            self.daemon_bps = (t, sent, recv)
+            return
+
+        log.debug("sent: %s recv: %s", deluge.common.fsize(sent), deluge.common.fsize(recv))
         delta_time = t - self.daemon_bps[0]
+        # The clock may have been set back, or the call fired twice in a row
+        if delta_time < 0.5:
+            return
         delta_sent = sent - self.daemon_bps[1]
         delta_recv = recv - self.daemon_bps[2]
 
@@ -274,10 +278,27 @@ class GtkUI(object):
         log.debug("sent rate: %s recv rate: %s", sent_rate, recv_rate)
         self.daemon_bps = (t, sent, recv)
 
+    def _register_gnome_session(self):
+        try:
+            import gnome.ui
+            import gnome
+            self.gnome_prog = gnome.init("Deluge", deluge.common.get_version())
+            self.gnome_client = gnome.ui.master_client()
+            def on_die(*args):
+                reactor.stop()
+            self.gnome_client.connect("die", on_die)
+            log.debug("GNOME session 'die' handler registered!")
+        except Exception, e:
+            log.warning("Unable to register a 'die' handler with the GNOME session manager: %s", e)
+
     def _on_reactor_start(self):
         log.debug("_on_reactor_start")
         self.mainwindow.first_show()
 
+        # Loading libgnomeui is slow, so register with the session manager
+        # once the window is up
+        reactor.callLater(1.0, self._register_gnome_session)
+
         if self.config["classic_mode"]:
 
             def on_dialog_response(response):
@@ -300,7 +321,6 @@ You will either need to stop the daemon or turn off Classic Mode to continue."))
                 self.started_in_classic = False
                 d.addCallback(on_dialog_response)
             except Exception, e:
-                import traceback
                 tb = sys.exc_info()
                 ed = dialogs.ErrorDialog(
                     _("Error Starting Core"),
@@ -334,83 +354,95 @@ Please see the details below for more information."), details=traceback.format_e
                         return
                     self.connectionmanager.builder.get_object("button_close").emit("clicked")
 
-                for host_config in self.connectionmanager.config["hosts"]:
+                hosts = dict((host_config[0], host_config) for host_config
+                             in self.connectionmanager.config["hosts"])
+                host_config = hosts.get(self.config["autoconnect_host_id"])
+                if host_config:
                     hostid, host, port, user, passwd = host_config
-                    if hostid == self.config["autoconnect_host_id"]:
-                        try_connect = True
-                        # Check to see if we need to start the localhost daemon
-                        if self.config["autostart_localhost"] and host in ("localhost", "127.0.0.1"):
-                            log.debug("Autostarting localhost:%s", host)
-                            try_connect = client.start_daemon(
-                                port, deluge.configmanager.get_config_dir()
-                            )
-                            log.debug("Localhost started: %s", try_connect)
-                            if not try_connect:
-                                dialogs.ErrorDialog(
-                                    _("Error Starting Daemon"),
-                                    _("There was an error starting the daemon "
-                                      "process.  Try running it from a console "
-                                      "to see if there is an error.")
-                                ).run()
-
-                            # Daemon Started, let's update it's info
-                            reactor.callLater(0.5, update_connection_manager)
-
-                        def on_connect(connector):
-                            component.start()
-                            reactor.callLater(0.2, update_connection_manager)
-                            reactor.callLater(0.5, close_connection_manager)
-
-                        def on_connect_fail(reason, try_counter,
-                                            host, port, user, passwd):
-                            if not try_counter:
-                                return
-
-                            if reason.check(deluge.error.AuthenticationRequired,
-                                            deluge.error.BadLoginError):
-                                log.debug("PasswordRequired exception")
-                                dialog = dialogs.AuthenticationDialog(
-                                    reason.value.message, reason.value.username
-                                )
-                                def dialog_finished(response_id, host, port):
-                                    if response_id == gtk.RESPONSE_OK:
-                                        reactor.callLater(
-                                            0.5, do_connect, try_counter-1,
-                                            host, port, dialog.get_username(),
-                                            dialog.get_password())
-                                dialog.run().addCallback(dialog_finished,
-                                                         host, port)
-                                return
-
-                            log.info("Connection to host failed..")
-                            log.info("Retrying connection.. Retries left: "
-                                     "%s", try_counter)
-                            reactor.callLater(0.5, update_connection_manager)
-                            reactor.callLater(0.5, do_connect, try_counter-1,
-                                              host, port, user, passwd)
-
-                        def do_connect(try_counter, host, port, user, passwd):
-                            log.debug("Trying to connect to %s@%s:%s",
-                                      user, host, port)
-                            d = client.connect(host, port, user, passwd)
-                            d.addCallback(on_connect)
-                            d.addErrback(on_connect_fail, try_counter,
-                                         host, port, user, passwd)
-
-                        if try_connect:
-                            reactor.callLater(
-                                0.5, do_connect, 6, host, port, user, passwd
+                    try_connect = True
+                    # Check to see if we need to start the localhost daemon
+                    if self.config["autostart_localhost"] and host in ("localhost", "127.0.0.1"):
+                        log.debug("Autostarting localhost:%s", host)
+                        try_connect = client.start_daemon(
+                            port, deluge.configmanager.get_config_dir()
+                        )
+                        log.debug("Localhost started: %s", try_connect)
+                        if not try_connect:
+                            dialogs.ErrorDialog(
+                                _("Error Starting Daemon"),
+                                _("There was an error starting the daemon "
+                                  "process.  Try running it from a console "
+                                  "to see if there is an error.")
+                            ).run()
+
+                        # Daemon Started, let's update it's info
+                        reactor.callLater(0.5, update_connection_manager)
+
+                    def on_connect(connector):
+                        component.start()
+                        reactor.callLater(0.2, update_connection_manager)
+                        reactor.callLater(0.5, close_connection_manager)
+
+                    def on_connect_fail(reason, try_counter,
+                                        host, port, user, passwd):
+                        if not try_counter:
+                            return
+
+                        if reason.check(deluge.error.AuthenticationRequired,
+                                        deluge.error.BadLoginError):
+                            log.debug("PasswordRequired exception")
+                            dialog = dialogs.AuthenticationDialog(
+                                reason.value.message, reason.value.username
                             )
-                        break
+                            def dialog_finished(response_id, host, port):
+                                if response_id == gtk.RESPONSE_OK:
+                                    reactor.callLater(
+                                        0.5, do_connect, try_counter-1,
+                                        host, port, dialog.get_username(),
+                                        dialog.get_password())
+                            dialog.run().addCallback(dialog_finished,
+                                                     host, port)
+                            return
+
+                        log.info("Connection to host failed..")
+                        log.info("Retrying connection.. Retries left: "
+                                 "%s", try_counter)
+                        reactor.callLater(0.5, retry_connect, try_counter-1,
+                                          host, port, user, passwd)
+
+                    def retry_connect(try_counter, host, port, user, passwd):
+                        # Refresh the connection manager and try again
+                        # from the one timer
+                        update_connection_manager()
+                        do_connect(try_counter, host, port, user, passwd)
+
+                    def do_connect(try_counter, host, port, user, passwd):
+                        log.debug("Trying to connect to %s@%s:%s",
+                                  user, host, port)
+                        d = client.connect(host, port, user, passwd)
+                        d.addCallback(on_connect)
+                        d.addErrback(on_connect_fail, try_counter,
+                                     host, port, user, passwd)
+
+                    if try_connect:
+                        reactor.callLater(
+                            0.5, do_connect, 6, host, port, user, passwd
+                        )
 
             if self.config["show_connection_manager_on_start"]:
-                # XXX: We need to call a simulate() here, but this could be a bug in twisted
-                try:
-                    reactor._simulate()
-                except AttributeError:
-                    # twisted < 12
-                    reactor.simulate()
-                self.connectionmanager.show()
+                def show_connection_manager():
+                    # XXX: We need to call a simulate() here, but this could be a bug in twisted
+                    try:
+                        reactor._simulate()
+                    except AttributeError:
+                        # twisted < 12
+                        reactor.simulate()
+                    self.connectionmanager.show()
+                    return False
+
+                # Let the main window finish drawing before the connection
+                # manager dialog is built and shown
+                gobject.idle_add(show_connection_manager)
 
 
     def __on_disconnect(self):
@@ -220,6 +220,10 @@ class StatusBar(component.Component):
             log.debug("Unable to remove StatusBar item: %s", e)
         self.show_not_connected()
 
+        # Don't hand out the previous session's rates
+        self.download_rate = ""
+        self.upload_rate = ""
+
     def visible(self, visible):
         if visible:
             self.statusbar.show()
@@ -310,6 +314,17 @@ class StatusBar(component.Component):
         else:
             self.remove_item(self.dht_item)
 
+    def get_rates(self):
+        """
+        Returns the last polled payload rates, already formatted, empty strings
+        until the first poll has returned.
+
+        :returns: (download_rate, upload_rate)
+        :rtype: tuple
+
+        """
+        return (self.download_rate, self.upload_rate)
+
     def _on_get_session_status(self, status):
         self.download_rate = deluge.common.fspeed(status["payload_download_rate"])
         self.upload_rate = deluge.common.fspeed(status["payload_upload_rate"])
@@ -38,6 +38,11 @@ try:
 except ImportError:
     appindicator = None
 
+try:
+    from hashlib import sha1 as sha_hash
+except ImportError:
+    from sha import new as sha_hash
+
 import os
 import gtk
 import logging
@@ -74,9 +79,8 @@ class SystemTray(component.Component):
         self.config.register_set_function("enable_appindicator", self.on_enable_appindicator_set)
 
         self.max_download_speed = -1.0
-        self.download_rate = 0.0
         self.max_upload_speed = -1.0
-        self.upload_rate = 0.0
+        self.update_tooltip_format()
 
         self.config_value_changed_dict = {
             "max_download_speed": self._on_max_download_speed,
@@ -100,6 +104,9 @@ class SystemTray(component.Component):
         })
 
         self.tray_menu = self.builder.get_object("tray_menu")
+        # Resolve the hide list once, __start() drops any that must stay hidden
+        self.hide_widgets = dict((widget, self.builder.get_object(widget))
+                                 for widget in self.hide_widget_list)
 
         if appindicator and self.config["enable_appindicator"]:
             log.debug("Enabling the Application Indicator..")
@@ -135,6 +142,8 @@ class SystemTray(component.Component):
                     log.warning("Update PyGTK to 2.10 or greater for SystemTray..")
                     return
 
+            # The text last passed to set_tooltip() by update()
+            self.tooltip = None
             self.tray.connect("activate", self.on_tray_clicked)
             self.tray.connect("popup-menu", self.on_tray_popup)
 
@@ -150,41 +159,36 @@ class SystemTray(component.Component):
             self.__start()
         else:
             # Hide menu widgets because we're not connected to a host.
-            for widget in self.hide_widget_list:
-                self.builder.get_object(widget).hide()
+            for widget in self.hide_widgets.itervalues():
+                widget.hide()
 
     def __start(self):
         if self.config["enable_system_tray"]:
 
+            always_hidden = []
             if self.config["classic_mode"]:
-                self.hide_widget_list.remove("menuitem_quitdaemon")
-                self.hide_widget_list.remove("separatormenuitem4")
-                self.builder.get_object("menuitem_quitdaemon").hide()
-                self.builder.get_object("separatormenuitem4").hide()
+                always_hidden.extend(["menuitem_quitdaemon", "separatormenuitem4"])
 
             # These do not work with appindicator currently and can crash Deluge.
             # Related to Launchpad bug #608219
             if appindicator and self.config["enable_appindicator"]:
-                self.hide_widget_list.remove("menuitem_download_limit")
-                self.hide_widget_list.remove("menuitem_upload_limit")
-                self.hide_widget_list.remove("separatormenuitem3")
-                self.builder.get_object("menuitem_download_limit").hide()
-                self.builder.get_object("menuitem_upload_limit").hide()
-                self.builder.get_object("separatormenuitem3").hide()
+                always_hidden.extend(["menuitem_download_limit",
+                                      "menuitem_upload_limit",
+                                      "separatormenuitem3"])
 
-            # Show widgets in the hide list because we've connected to a host
-            for widget in self.hide_widget_list:
-                self.builder.get_object(widget).show()
+            for name in always_hidden:
+                widget = self.hide_widgets.pop(name, None)
+                if widget is not None:
+                    widget.hide()
 
-            # Build the bandwidth speed limit menus
-            self.build_tray_bwsetsubmenu()
+            # Show widgets in the hide list because we've connected to a host
+            for widget in self.hide_widgets.itervalues():
+                widget.show()
 
-            # Get some config values
-            client.core.get_config_value(
-                "max_download_speed").addCallback(self._on_max_download_speed)
-            client.core.get_config_value(
-                "max_upload_speed").addCallback(self._on_max_upload_speed)
-            self.send_status_request()
+            # Get the speed limits and build the bandwidth speed limit menus
+            client.core.get_config_values(
+                ["max_download_speed", "max_upload_speed"]
+            ).addCallback(self._on_get_max_speeds)
 
     def start(self):
         self.__start()
@@ -193,12 +197,13 @@ class SystemTray(component.Component):
         if self.config["enable_system_tray"] and not self.config["enable_appindicator"]:
             try:
                 # Hide widgets in hide list because we're not connected to a host
-                for widget in self.hide_widget_list:
-                    self.builder.get_object(widget).hide()
+                for widget in self.hide_widgets.itervalues():
+                    widget.hide()
             except Exception, e:
                 log.debug("Unable to hide system tray menu widgets: %s", e)
 
             self.tray.set_tooltip(_("Deluge") + "\n" + _("Not Connected..."))
+            self.tooltip = None
 
     def shutdown(self):
         if self.config["enable_system_tray"]:
@@ -207,32 +212,32 @@ class SystemTray(component.Component):
             else:
                 self.tray.set_visible(False)
 
-    def send_status_request(self):
-        client.core.get_session_status([
-            "payload_upload_rate",
-            "payload_download_rate"]).addCallback(self._on_get_session_status)
-
     def config_value_changed(self, key, value):
         """This is called when we received a config_value_changed signal from
         the core."""
 
-        if key in self.config_value_changed_dict.keys():
-            self.config_value_changed_dict[key](value)
+        func = self.config_value_changed_dict.get(key)
+        if func is not None:
+            func(value)
+
+    def _on_get_max_speeds(self, config):
+        self.max_download_speed = config["max_download_speed"]
+        self.max_upload_speed = config["max_upload_speed"]
+        self.update_tooltip_format()
+        self.build_tray_bwsetsubmenu()
 
     def _on_max_download_speed(self, max_download_speed):
         if self.max_download_speed != max_download_speed:
             self.max_download_speed = max_download_speed
+            self.update_tooltip_format()
             self.build_tray_bwsetsubmenu()
 
     def _on_max_upload_speed(self, max_upload_speed):
         if self.max_upload_speed != max_upload_speed:
             self.max_upload_speed = max_upload_speed
+            self.update_tooltip_format()
             self.build_tray_bwsetsubmenu()
 
-    def _on_get_session_status(self, status):
-        self.download_rate = deluge.common.fsize(status["payload_download_rate"])
-        self.upload_rate = deluge.common.fsize(status["payload_upload_rate"])
-
     def update(self):
         if not self.config["enable_system_tray"]:
             return
@@ -241,27 +246,51 @@ class SystemTray(component.Component):
         if appindicator and self.config["enable_appindicator"]:
             return
 
-        # Set the tool tip text
-        max_download_speed = self.max_download_speed
-        max_upload_speed = self.max_upload_speed
+        # Nobody can hover the icon if it isn't shown in a notification area
+        if not self.tray.get_visible() or not self.tray.is_embedded():
+            return
 
-        if max_download_speed == -1:
-            max_download_speed = _("Unlimited")
-        else:
-            max_download_speed = "%s %s" % (max_download_speed, _("KiB/s"))
-        if max_upload_speed == -1:
-            max_upload_speed = _("Unlimited")
-        else:
-            max_upload_speed = "%s %s" % (max_upload_speed, _("KiB/s"))
+        # The StatusBar already polls the session rates, so use its values
+        # rather than sending a request of our own, unless it has none yet
+        download_rate, upload_rate = component.get("StatusBar").get_rates()
+        if not download_rate:
+            self.send_status_request()
+            return
 
-        msg = '%s\n%s: %s (%s)\n%s: %s (%s)' % (\
-            _("Deluge"), _("Down"), self.download_rate, \
-            max_download_speed, _("Up"), self.upload_rate, max_upload_speed)
+        self.update_tooltip(download_rate, upload_rate)
 
-        # Set the tooltip
-        self.tray.set_tooltip(msg)
+    def send_status_request(self):
+        client.core.get_session_status([
+            "payload_upload_rate",
+            "payload_download_rate"]).addCallback(self._on_get_session_status)
 
-        self.send_status_request()
+    def _on_get_session_status(self, status):
+        # Keep the "Not Connected" tooltip if we disconnected in the meantime
+        if not client.connected():
+            return
+        self.update_tooltip(
+            deluge.common.fspeed(status["payload_download_rate"]),
+            deluge.common.fspeed(status["payload_upload_rate"]))
+
+    def update_tooltip(self, download_rate, upload_rate):
+        msg = self.tooltip_format % (download_rate, upload_rate)
+
+        # Set the tooltip, unless it would not change
+        if msg != self.tooltip:
+            self.tray.set_tooltip(msg)
+            self.tooltip = msg
+
+    def update_tooltip_format(self):
+        """Rebuilds the tooltip template, only the rates are filled in by
+        update()."""
+        def speed_limit(value):
+            if value == -1:
+                return _("Unlimited")
+            return "%s %s" % (value, _("KiB/s"))
+
+        self.tooltip_format = "%s\n%s: %%s (%s)\n%s: %%s (%s)" % (
+            _("Deluge"), _("Down"), speed_limit(self.max_download_speed),
+            _("Up"), speed_limit(self.max_upload_speed))
 
     def build_tray_bwsetsubmenu(self):
         # Create the Download speed list sub-menu
@@ -311,6 +340,7 @@ class SystemTray(component.Component):
                 del self.tray
             del self.builder
             del self.tray_menu
+            del self.hide_widgets
         except Exception, e:
             log.debug("Unable to disable system tray: %s", e)
 
@@ -419,26 +449,26 @@ class SystemTray(component.Component):
 
     def setbwlimit(self, widget, string, core_key, ui_key, default, image):
         """Sets the bandwidth limit based on the user selection."""
-        value = widget.get_children()[0].get_text().rstrip(" " + _("KiB/s"))
-        if value == _("Unlimited"):
-            value = -1
+        # The radio items also emit "toggled" when they are deactivated by the
+        # newly selected item, only act on the selected one
+        if isinstance(widget, gtk.RadioMenuItem) and not widget.get_active():
+            return
 
-        if value == _("Other..."):
-            value = common.show_other_dialog(string, _("KiB/s"), None, image, default)
-            if value == None:
-                return
+        # Only the items built from the speed list carry a value
+        value = widget.get_data("value")
+        if value is None:
+            if widget.get_name() == _("Other..."):
+                value = common.show_other_dialog(string, _("KiB/s"), None, image, default)
+                if value == None:
+                    return
+            else:
+                value = -1
 
-        # Set the config in the core
+        # Set the config in the core, the menus are rebuilt when the
+        # ConfigValueChangedEvent comes back
         client.core.set_config({core_key: value})
 
-        self.build_tray_bwsetsubmenu()
-
     def unlock_tray(self, is_showing_dlg=[False]):
-        try:
-            from hashlib import sha1 as sha_hash
-        except ImportError:
-            from sha import new as sha_hash
-
         log.debug("Show tray lock dialog")
 
         if is_showing_dlg[0]:
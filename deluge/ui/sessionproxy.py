@@ -42,6 +42,16 @@ import time
 
 log = logging.getLogger(__name__)
 
+# These initial keys are the ones used for the visible columns (by default) on
+# the GTK UI torrent view. If either the console-ui or the web-ui needs
+# additional keys, add them here; There's NO need to fetch every bit of status
+# information from core if it's not going to be used. Additional status fields
+# will be queried later, for example, when viewing the status tab of a torrent.
+INITIAL_KEYS = [
+    'queue', 'state', 'name', 'total_wanted', 'progress',
+    'download_payload_rate', 'upload_payload_rate', 'eta', 'owner'
+]
+
 class SessionProxy(component.Component):
     """
     The SessionProxy component is used to cache session information client-side
@@ -78,18 +88,7 @@ class SessionProxy(component.Component):
                 # so that upcoming queries or status updates don't throw errors.
                 self.torrents.setdefault(torrent_id, [time.time(), {}])
                 self.cache_times.setdefault(torrent_id, {})
-            # These initial keys are the ones used for the visible columns(by
-            # default) on the GTK UI torrent view. If either the console-ui
-            # or the web-ui needs additional keys, add them here;
-            # There's NO need to fetch every bit of status information from
-            # core if it's not going to be used. Additional status fields
-            # will be queried later, for example, when viewing the status tab
-            # of a torrent.
-            inital_keys = [
-                'queue', 'state', 'name', 'total_wanted', 'progress', 'state',
-                'download_payload_rate', 'upload_payload_rate', 'eta', 'owner'
-            ]
-            self.get_torrents_status({'id': torrent_ids}, inital_keys)
+            self.get_torrents_status({'id': torrent_ids}, INITIAL_KEYS)
         return client.core.get_session_state().addCallback(on_get_session_state)
 
     def stop(self):
@@ -270,7 +269,9 @@ class SessionProxy(component.Component):
             t = time.time()
             for key in status:
                 self.cache_times[torrent_id][key] = t
-        client.core.get_torrent_status(torrent_id, []).addCallback(on_status)
+        # Only fetch the keys the views need up front, like on start-up, the
+        # rest are fetched when they are asked for
+        client.core.get_torrent_status(torrent_id, INITIAL_KEYS).addCallback(on_status)
 
     def on_torrent_removed(self, torrent_id):
         if torrent_id in self.torrents: